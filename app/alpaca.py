@@ -0,0 +1,231 @@
+"""
+Alpaca trading API client.
+
+One ``AlpacaClient`` is created for the lifetime of the app (see
+``main.lifespan``) so connections are pooled and kept alive over HTTP/2.
+Concurrent upstream calls are bounded, rate-limited and failed requests are
+retried with jittered backoff, and identical GETs that are already in flight
+are coalesced so many dashboard viewers cause a single upstream call.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ALPACA_API_KEY = os.getenv("ALPACA_API_KEY", "")
+ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY", "")
+ALPACA_API_BASE_URL = os.getenv("ALPACA_API_BASE_URL", "https://paper-api.alpaca.markets")
+ALPACA_DATA_BASE_URL = os.getenv("ALPACA_DATA_BASE_URL", "https://data.alpaca.markets")
+ALPACA_DATA_FEED = os.getenv("ALPACA_DATA_FEED", "iex")  # iex (free) or sip
+
+ALPACA_HTTP2 = os.getenv("ALPACA_HTTP2", "True").lower() == "true"
+ALPACA_HTTP_TIMEOUT = float(os.getenv("ALPACA_HTTP_TIMEOUT", "10"))
+ALPACA_MAX_CONCURRENCY = int(os.getenv("ALPACA_MAX_CONCURRENCY", "10"))
+ALPACA_MAX_RETRIES = int(os.getenv("ALPACA_MAX_RETRIES", "3"))
+ALPACA_RETRY_BACKOFF = float(os.getenv("ALPACA_RETRY_BACKOFF", "0.5"))  # Base delay in seconds
+ALPACA_MAX_RETRY_DELAY = 30.0
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Methods that may be repeated after a server error without side effects
+IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE"}
+
+class AlpacaError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Alpaca API error {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Seconds to wait before retrying, from Retry-After (seconds or HTTP date)
+    or Alpaca's X-RateLimit-Reset (epoch seconds) on rate-limited responses.
+    """
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                parsed = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                # Malformed date; the caller falls back to jittered backoff
+                parsed = None
+            if parsed is not None:
+                return max(0.0, parsed.timestamp() - time.time())
+    reset = response.headers.get("x-ratelimit-reset")
+    if reset and response.status_code == 429:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+def _backoff(attempt: int) -> float:
+    # Full jitter keeps many workers from retrying in lockstep
+    return random.uniform(0, min(ALPACA_MAX_RETRY_DELAY, ALPACA_RETRY_BACKOFF * 2 ** attempt))
+
+class AlpacaClient:
+    def __init__(
+        self,
+        api_key: str = ALPACA_API_KEY,
+        secret_key: str = ALPACA_SECRET_KEY,
+        base_url: str = ALPACA_API_BASE_URL,
+        max_concurrency: int = ALPACA_MAX_CONCURRENCY,
+        max_retries: int = ALPACA_MAX_RETRIES,
+        http2: bool = ALPACA_HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.max_retries = max_retries
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"APCA-API-KEY-ID": api_key, "APCA-API-SECRET-KEY": secret_key},
+            timeout=ALPACA_HTTP_TIMEOUT,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency
+            ),
+            transport=transport
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0}
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def request(self, method: str, path: str, **kwargs) -> Any:
+        """
+        Send a request and return the decoded JSON body. Connection errors,
+        429s and (for idempotent methods) 5xx responses are retried.
+        Raises AlpacaError once retries are exhausted or on other errors.
+        """
+        method = method.upper()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    response = await self._client.request(method, path, **kwargs)
+            except httpx.TransportError as exc:
+                # Failing to connect means Alpaca never saw the request
+                retryable = method in IDEMPOTENT_METHODS or isinstance(
+                    exc, (httpx.ConnectError, httpx.ConnectTimeout)
+                )
+                if not retryable or attempt >= self.max_retries:
+                    raise AlpacaError(503, str(exc) or exc.__class__.__name__) from exc
+                delay = _backoff(attempt)
+            else:
+                retryable = response.status_code == 429 or (
+                    response.status_code in RETRYABLE_STATUS_CODES and method in IDEMPOTENT_METHODS
+                )
+                if response.is_success:
+                    return response.json() if response.content else None
+                if not retryable or attempt >= self.max_retries:
+                    raise AlpacaError(response.status_code, _error_message(response))
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = _backoff(attempt)
+                delay = min(delay, ALPACA_MAX_RETRY_DELAY)
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, path: str, params: Optional[dict] = None) -> Any:
+        """
+        GET ``path``, sharing the result with identical GETs already in
+        flight. Callers must treat the returned data as read-only.
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # Shielded so one caller going away does not cancel the others
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self.request("GET", path, params=params))
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Tuple, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            # Mark the error as retrieved in case every waiter went away
+            future.exception()
+
+    async def get_account(self) -> dict:
+        return await self.get("/v2/account")
+
+    async def get_positions(self) -> list:
+        return await self.get("/v2/positions")
+
+    async def get_orders(self, status: str = "open", limit: int = 50) -> list:
+        return await self.get("/v2/orders", {"status": status, "limit": limit})
+
+    async def get_clock(self) -> dict:
+        return await self.get("/v2/clock")
+
+    async def get_bars(self, symbol: str, timeframe: str, start: str, end: str) -> list:
+        """
+        Historical bars from the market data API, following pagination.
+        ``timeframe`` is Alpaca's notation (1Min, 5Min, 1Hour, 1Day) and
+        ``start``/``end`` are inclusive RFC 3339 timestamps.
+        """
+        params = {
+            "timeframe": timeframe,
+            "start": start,
+            "end": end,
+            "limit": 10000,
+            "feed": ALPACA_DATA_FEED,
+            "adjustment": "raw"
+        }
+        bars = []
+        while True:
+            page = await self.get(f"{ALPACA_DATA_BASE_URL}/v2/stocks/{symbol}/bars", params)
+            bars.extend(page.get("bars") or ())
+            token = page.get("next_page_token")
+            if not token:
+                return bars
+            params = {**params, "page_token": token}
+
+    async def submit_order(self, **order) -> dict:
+        return await self.request("POST", "/v2/orders", json=order)
+
+    async def cancel_order(self, order_id: str):
+        return await self.request("DELETE", f"/v2/orders/{order_id}")
+
+def _error_message(response: httpx.Response) -> str:
+    try:
+        body = response.json()
+    except ValueError:
+        return response.text
+    return body.get("message", response.text) if isinstance(body, dict) else response.text
+
+_client: Optional[AlpacaClient] = None
+
+async def start_client() -> AlpacaClient:
+    """Create the shared client; called from the app lifespan."""
+    global _client
+    if _client is None:
+        _client = AlpacaClient()
+    return _client
+
+def get_client() -> AlpacaClient:
+    if _client is None:
+        raise RuntimeError("Alpaca client is not running; it is started by the app lifespan")
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,146 @@
+"""
+Static asset pipeline.
+
+``python -m app.assets`` copies every file under app/static into
+app/static/dist with a content hash in its name (app.css -> app.3f2a9c1e.css)
+and writes .gz and .br siblings next to it, plus a manifest.json mapping the
+original path to the fingerprinted one. Templates call ``static_url()`` to
+emit the fingerprinted URL, and ``PrecompressedStaticFiles`` serves the best
+precompressed variant with a long-lived immutable Cache-Control header.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Optional
+
+import brotli
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Scope
+
+STATIC_DIR = Path("app/static")
+DIST_DIRNAME = "dist"
+MANIFEST_NAME = "manifest.json"
+STATIC_URL_PREFIX = "/static"
+
+# Only text-like assets benefit from precompression
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".map", ".svg", ".json", ".html", ".txt", ".xml", ".ico"}
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _fingerprint(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:8]
+
+def build_assets(static_dir: Path = STATIC_DIR) -> dict:
+    """
+    Build fingerprinted and precompressed copies of the static files.
+    Returns the manifest ({"css/app.css": "dist/css/app.3f2a9c1e.css", ...}).
+    """
+    dist_dir = static_dir / DIST_DIRNAME
+    if dist_dir.exists():
+        shutil.rmtree(dist_dir)
+    dist_dir.mkdir(parents=True)
+
+    manifest = {}
+    for source in sorted(static_dir.rglob("*")):
+        if not source.is_file() or dist_dir in source.parents:
+            continue
+        relative = source.relative_to(static_dir)
+        hashed_name = f"{source.stem}.{_fingerprint(source)}{source.suffix}"
+        target = dist_dir / relative.parent / hashed_name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source, target)
+
+        data = source.read_bytes()
+        if source.suffix.lower() in COMPRESSIBLE_SUFFIXES and len(data) >= MIN_COMPRESS_SIZE:
+            target.with_name(target.name + ".gz").write_bytes(
+                gzip.compress(data, compresslevel=9, mtime=0)
+            )
+            target.with_name(target.name + ".br").write_bytes(
+                brotli.compress(data, quality=11)
+            )
+        manifest[relative.as_posix()] = target.relative_to(static_dir).as_posix()
+
+    (dist_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+_manifest: Optional[dict] = None
+
+def load_manifest(static_dir: Path = STATIC_DIR) -> dict:
+    global _manifest
+    if _manifest is None:
+        try:
+            _manifest = json.loads((static_dir / DIST_DIRNAME / MANIFEST_NAME).read_text())
+        except (FileNotFoundError, ValueError):
+            _manifest = {}
+    return _manifest
+
+def static_url(path: str) -> str:
+    """
+    URL for a static asset, pointing at the fingerprinted copy when the
+    asset pipeline has been built and at the original file otherwise.
+    """
+    path = path.lstrip("/")
+    return f"{STATIC_URL_PREFIX}/{load_manifest().get(path, path)}"
+
+def accepted_encodings(header: str) -> set:
+    """Content codings from an Accept-Encoding header, minus any with q=0."""
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves a prebuilt .br/.gz variant when the client
+    accepts it, and marks fingerprinted files under dist/ as immutable.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse):
+            return response
+
+        is_fingerprinted = Path(path).parts[:1] == (DIST_DIRNAME,)
+        if is_fingerprinted:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            variant_path = response.path + suffix
+            try:
+                variant_stat = os.stat(variant_path)
+            except FileNotFoundError:
+                continue
+            headers = {"Vary": "Accept-Encoding", "Content-Encoding": encoding}
+            if is_fingerprinted:
+                headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            return FileResponse(
+                variant_path,
+                status_code=response.status_code,
+                headers=headers,
+                media_type=response.media_type,
+                stat_result=variant_stat
+            )
+
+        if is_fingerprinted:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+if __name__ == "__main__":
+    static_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else STATIC_DIR
+    manifest = build_assets(static_dir)
+    print(f"Built {len(manifest)} assets into {static_dir / DIST_DIRNAME}")
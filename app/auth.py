@@ -1,12 +1,20 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import MappingProxyType
+import asyncio
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status, Cookie
+from fastapi import Depends, HTTPException, Request, status, Cookie
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas
-from .database import get_db
+from .database import get_db, session_scope, DATA_DIR
+from .cache import KeyedVersionCounter, TTLCache
+from . import metrics
 import os
 from dotenv import load_dotenv
 
@@ -22,12 +30,103 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Password hashing worker pool
+# bcrypt is deliberately slow, so it runs on a bounded thread pool instead of
+# the event loop. Once PASSWORD_HASH_MAX_PENDING operations are in flight new
+# requests are rejected with 503 rather than queueing without limit.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+_hash_executor: Optional[ThreadPoolExecutor] = None
+# Only touched from the event loop thread, so no locking is required
+_hash_pending = 0
+_hash_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "rejected": 0,
+    "max_pending": 0
+}
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _timed(func, *args):
+    # Runs on the worker thread, so queueing time is not included
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        metrics.password_hash_duration_seconds.observe(time.perf_counter() - start)
+
+def _get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            thread_name_prefix="password-hash"
+        )
+    return _hash_executor
+
+async def _run_in_hash_pool(func, *args):
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        _hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    _hash_stats["submitted"] += 1
+    _hash_stats["max_pending"] = max(_hash_stats["max_pending"], _hash_pending)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_executor(), _timed, func, *args)
+    finally:
+        _hash_pending -= 1
+        _hash_stats["completed"] += 1
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_in_hash_pool(get_password_hash, password)
+
+async def get_password_hashes_async(passwords):
+    """
+    Hash many passwords in parallel without using more than the pool width,
+    leaving the pending-operation budget free for interactive logins.
+    """
+    semaphore = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
+    async def _hash(password):
+        async with semaphore:
+            return await get_password_hash_async(password)
+
+    return await asyncio.gather(*(_hash(password) for password in passwords))
+
+def get_hash_pool_stats():
+    """
+    Snapshot of the password hashing pool.
+    "queued" is the number of operations waiting for a free worker.
+    """
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending_limit": PASSWORD_HASH_MAX_PENDING,
+        "in_flight": _hash_pending,
+        "queued": max(0, _hash_pending - PASSWORD_HASH_WORKERS),
+        **_hash_stats
+    }
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -38,38 +137,167 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+# Verified token cache
+# Clients poll with the same cookie many times a second, so the claims of
+# already-verified tokens are cached until they expire (capped by the TTL).
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "8192"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+def decode_access_token(token: str):
+    """
+    Verify ``token`` and return its claims as a read-only mapping.
+    Raises JWTError for invalid or expired tokens, which are never cached.
+    """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    payload = MappingProxyType(jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]))
+    ttl = TOKEN_CACHE_TTL
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    if ttl > 0:
+        token_cache.set(token, payload, ttl=ttl)
+    return payload
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await db.scalar(select(models.User).where(models.User.username == username))
+    if not user:
+        return False
+    # Release the pooled connection while bcrypt runs on the worker pool
+    await db.commit()
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
+# Principal cache
+# Authenticated requests only need a small, read-only view of the user and
+# their role name. Snapshots are cached per worker and tagged with that
+# user's version file, so a change made by any worker invalidates the edited
+# user everywhere and leaves every other cached principal alone.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+user_versions = KeyedVersionCounter(DATA_DIR / ".users")
+
+@dataclass(frozen=True)
+class Principal:
+    """Immutable snapshot of an authenticated user and their role."""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    role_id: Optional[int]
+    role_name: Optional[str]
+
+    def is_superadmin(self):
+        return self.role_name == "superadmin"
+
+    def is_admin(self):
+        return self.role_name in ["superadmin", "admin"]
+
+async def get_principal(db: Optional[AsyncSession], username: str) -> Optional[Principal]:
+    """
+    Return the cached principal for ``username``, loading the user and role
+    name with a single query on a miss. Unknown users are not cached.
+    A short-lived session is opened on a miss when ``db`` is None.
+    """
+    version = user_versions.current(username)
+    cached = principal_cache.get(username)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if db is None:
+        async with session_scope() as session:
+            return await get_principal(session, username)
+
+    result = await db.execute(
+        select(models.User, models.Role.name)
+        .outerjoin(models.Role, models.Role.id == models.User.role_id)
+        .where(models.User.username == username)
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+    row = result.first()
+    if row is None:
+        return None
+    user, role_name = row
+    principal = Principal(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_active=user.is_active,
+        role_id=user.role_id,
+        role_name=role_name
+    )
+    principal_cache.set(username, (version, principal))
+    return principal
+
+def invalidate_principal(username: str):
+    """Forget ``username`` locally and signal the other workers."""
+    principal_cache.pop(username)
+    user_versions.bump(username)
+
+# Role cache
+# The roles table holds a handful of rows that are only ever added, so the
+# full list is kept per worker and reloaded when an unknown id shows up.
+_role_cache: List[schemas.Role] = []
+
+async def get_roles(db: AsyncSession) -> List[schemas.Role]:
+    if not _role_cache:
+        await refresh_roles(db)
+    return _role_cache
+
+async def refresh_roles(db: AsyncSession) -> List[schemas.Role]:
+    roles = (await db.scalars(select(models.Role).order_by(models.Role.id))).all()
+    _role_cache[:] = [schemas.Role.model_validate(role) for role in roles]
+    return _role_cache
+
+def invalidate_roles():
+    _role_cache.clear()
+
+async def get_role_names(db: AsyncSession, role_ids=()) -> dict:
+    """
+    Return a role id -> name map, reloading once if any of ``role_ids``
+    is not known yet (e.g. a role created by another worker).
+    """
+    roles = await get_roles(db)
+    names = {role.id: role.name for role in roles}
+    if any(role_id is not None and role_id not in names for role_id in role_ids):
+        roles = await refresh_roles(db)
+        names = {role.id: role.name for role in roles}
+    return names
+
+async def get_principal_from_token(access_token: str, db: Optional[AsyncSession] = None) -> Optional[Principal]:
+    """
+    Resolve a "Bearer <jwt>" cookie or header value to a principal.
+    Raises JWTError for invalid tokens; returns None for unknown users.
+    """
+    token = access_token.replace("Bearer ", "")
+    payload = decode_access_token(token)
+    username = payload.get("sub")
+    if username is None:
+        raise JWTError("Token has no subject")
+    return await get_principal(db, username)
+
+async def get_current_user(request: Request):
+    """Return the principal resolved by the auth middleware for this request."""
+    user = getattr(request.state, "user", None)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
-async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
-
 def check_admin_access(user: models.User):
     if not user.is_admin():
         raise HTTPException(
@@ -0,0 +1,309 @@
+"""
+Vectorized strategy backtests.
+
+A strategy turns bar columns into a position per bar (1 long, -1 short,
+0 flat) with whole-array NumPy operations; ``evaluate`` then scores the
+positions in one pass. A position decided at a bar's close is held over
+the next bar, so strategies never see the bar they are trading.
+
+Parameter sweeps evaluate every combination of a grid. Small sweeps run in
+this process; larger ones are split into chunks for a pool of worker
+processes, which read the bars from one shared memory block instead of
+receiving a pickled copy per chunk. This module only depends on NumPy so
+the spawned workers start quickly.
+"""
+import asyncio
+import itertools
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "0")) or os.cpu_count() or 1
+BACKTEST_MAX_COMBINATIONS = int(os.getenv("BACKTEST_MAX_COMBINATIONS", "1000"))
+# Sweeps with fewer combinations than this are not worth shipping to workers
+BACKTEST_MIN_PARALLEL_COMBINATIONS = int(os.getenv("BACKTEST_MIN_PARALLEL_COMBINATIONS", "8"))
+
+SHARED_COLUMNS = ("open", "high", "low", "close", "volume")
+TRADING_SECONDS_PER_YEAR = 252 * 6.5 * 3600
+
+class Indicators:
+    """
+    Bar columns plus memoized rolling indicators, so the combinations of a
+    sweep that share a window compute it once.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        self.close = columns["close"]
+        self._cache: Dict[Tuple, np.ndarray] = {}
+
+    def _cumsum(self, key: str, values: np.ndarray) -> np.ndarray:
+        cached = self._cache.get((key,))
+        if cached is None:
+            cached = self._cache[(key,)] = np.concatenate(([0.0], np.cumsum(values, dtype="f8")))
+        return cached
+
+    def sma(self, window: int) -> np.ndarray:
+        """Simple moving average of the close; NaN until ``window`` bars exist."""
+        key = ("sma", window)
+        cached = self._cache.get(key)
+        if cached is None:
+            sums = self._cumsum("close", self.close)
+            cached = np.full(len(self.close), np.nan)
+            if 0 < window <= len(self.close):
+                cached[window - 1:] = (sums[window:] - sums[:-window]) / window
+            self._cache[key] = cached
+        return cached
+
+    def std(self, window: int) -> np.ndarray:
+        """Rolling population standard deviation of the close."""
+        key = ("std", window)
+        cached = self._cache.get(key)
+        if cached is None:
+            squares = self._cumsum("close_squared", self.close * self.close)
+            cached = np.full(len(self.close), np.nan)
+            if 0 < window <= len(self.close):
+                mean_of_squares = (squares[window:] - squares[:-window]) / window
+                cached[window - 1:] = np.sqrt(np.maximum(mean_of_squares - self.sma(window)[window - 1:] ** 2, 0))
+            self._cache[key] = cached
+        return cached
+
+    def change(self, lookback: int) -> np.ndarray:
+        """Fractional change of the close over ``lookback`` bars."""
+        key = ("change", lookback)
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = np.full(len(self.close), np.nan)
+            if 0 < lookback < len(self.close):
+                cached[lookback:] = self.close[lookback:] / self.close[:-lookback] - 1
+            self._cache[key] = cached
+        return cached
+
+@dataclass(frozen=True)
+class Strategy:
+    signal: Callable[..., np.ndarray]
+    defaults: Dict[str, float]
+    description: str
+
+STRATEGIES: Dict[str, Strategy] = {}
+
+def strategy(name: str, **defaults):
+    def register(signal):
+        STRATEGIES[name] = Strategy(signal, defaults, (signal.__doc__ or "").strip())
+        return signal
+    return register
+
+# NaN comparisons are False, so every strategy is flat until its indicators
+# have enough history
+
+@strategy("sma_crossover", fast=10, slow=30)
+def sma_crossover(ind: Indicators, fast: int, slow: int) -> np.ndarray:
+    """Long while the fast moving average is above the slow one."""
+    return (ind.sma(int(fast)) > ind.sma(int(slow))).astype("f8")
+
+@strategy("momentum", lookback=20, threshold=0.0)
+def momentum(ind: Indicators, lookback: int, threshold: float) -> np.ndarray:
+    """Long after rising more than ``threshold`` over ``lookback`` bars, short after falling as much."""
+    change = ind.change(int(lookback))
+    return (change > threshold).astype("f8") - (change < -threshold).astype("f8")
+
+@strategy("mean_reversion", window=20, entry_z=2.0)
+def mean_reversion(ind: Indicators, window: int, entry_z: float) -> np.ndarray:
+    """Long below the band of ``entry_z`` standard deviations around the moving average, short above it."""
+    window = int(window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (ind.close - ind.sma(window)) / ind.std(window)
+    return (z < -entry_z).astype("f8") - (z > entry_z).astype("f8")
+
+def bars_per_year(timeframe_seconds: int) -> float:
+    if timeframe_seconds >= 86400:
+        return 252 * 86400 / timeframe_seconds
+    return TRADING_SECONDS_PER_YEAR / timeframe_seconds
+
+def evaluate(close: np.ndarray, positions: np.ndarray, fee_bps: float, periods_per_year: float) -> dict:
+    """
+    Score ``positions`` against ``close``. Every change of position pays
+    ``fee_bps`` basis points on the traded amount.
+    """
+    if len(close) < 2:
+        return {"total_return": 0.0, "sharpe": 0.0, "max_drawdown": 0.0, "trades": 0, "exposure": 0.0}
+    held = positions[:-1]
+    turnover = np.abs(np.diff(held, prepend=0.0))
+    returns = held * (close[1:] / close[:-1] - 1) - turnover * (fee_bps / 10000)
+    # A position cannot lose more than the whole account
+    np.maximum(returns, -1.0, out=returns)
+    with np.errstate(over="ignore", invalid="ignore"):
+        equity = np.cumprod(1 + returns)
+        deviation = returns.std()
+        drawdown = 1 - equity / np.maximum.accumulate(np.maximum(equity, 1.0))
+        sharpe = returns.mean() / deviation * math.sqrt(periods_per_year) if deviation > 0 else 0.0
+    return {
+        "total_return": _finite(equity[-1] - 1),
+        "sharpe": _finite(sharpe),
+        "max_drawdown": _finite(drawdown.max()),
+        "trades": int(np.count_nonzero(turnover)),
+        "exposure": float(np.count_nonzero(held) / len(held)),
+    }
+
+def _finite(value) -> Optional[float]:
+    # Degenerate price series can overflow; JSON and SQL have no NaN
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def expand_grid(strategy_name: str, grid: Dict[str, List[float]]) -> List[Dict[str, float]]:
+    """
+    Every combination of the grid's values, with the strategy's defaults for
+    parameters the grid leaves out. Raises ValueError for unknown strategies
+    or parameters and for grids over BACKTEST_MAX_COMBINATIONS.
+    """
+    strategy = STRATEGIES.get(strategy_name)
+    if strategy is None:
+        raise ValueError(f"Unknown strategy: {strategy_name}")
+    unknown = sorted(set(grid) - set(strategy.defaults))
+    if unknown:
+        raise ValueError(f"Unknown parameters for {strategy_name}: {', '.join(unknown)}")
+    names = list(strategy.defaults)
+    values = [list(grid.get(name) or [strategy.defaults[name]]) for name in names]
+    count = math.prod(len(options) for options in values)
+    if count > BACKTEST_MAX_COMBINATIONS:
+        raise ValueError(f"The grid has {count} combinations, at most {BACKTEST_MAX_COMBINATIONS} are allowed")
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+def run_combinations(columns: Dict[str, np.ndarray], strategy_name: str, combinations: List[Dict[str, float]],
+                     fee_bps: float, periods_per_year: float) -> List[dict]:
+    ind = Indicators(columns)
+    signal = STRATEGIES[strategy_name].signal
+    return [
+        evaluate(ind.close, signal(ind, **params), fee_bps, periods_per_year)
+        for params in combinations
+    ]
+
+# Worker processes
+
+_attached: Dict[str, Tuple[SharedMemory, Dict[str, np.ndarray]]] = {}
+
+def _attach(name: str, length: int) -> Dict[str, np.ndarray]:
+    if name not in _attached:
+        for shm, _ in _attached.values():
+            shm.close()
+        _attached.clear()
+        # Pool workers share the parent's resource tracker, and the parent
+        # unlinks the block once the sweep is done
+        shm = SharedMemory(name=name)
+        data = np.ndarray((len(SHARED_COLUMNS), length), dtype="f8", buffer=shm.buf)
+        _attached[name] = (shm, dict(zip(SHARED_COLUMNS, data)))
+    return _attached[name][1]
+
+def _run_chunk(name: str, length: int, strategy_name: str, combinations: List[Dict[str, float]],
+               fee_bps: float, periods_per_year: float) -> List[dict]:
+    return run_combinations(_attach(name, length), strategy_name, combinations, fee_bps, periods_per_year)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    The shared process pool, restarted when a sweep asks for a different
+    number of workers. The app always uses BACKTEST_WORKERS, so in practice
+    this only happens in the benchmark.
+    """
+    global _executor, _executor_workers
+    if _executor is not None and _executor_workers != workers:
+        shutdown_executor()
+    if _executor is None:
+        # spawn, because forking a process that runs threads and an event
+        # loop can deadlock the child
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        _executor_workers = workers
+    return _executor
+
+def shutdown_executor():
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _executor_workers = 0
+
+def _share(columns: Dict[str, np.ndarray]) -> SharedMemory:
+    length = len(columns["close"])
+    shm = SharedMemory(create=True, size=max(1, len(SHARED_COLUMNS) * length * 8))
+    data = np.ndarray((len(SHARED_COLUMNS), length), dtype="f8", buffer=shm.buf)
+    for row, column in zip(data, SHARED_COLUMNS):
+        row[:] = columns[column]
+    return shm
+
+async def run_sweep(columns: Dict[str, np.ndarray], strategy_name: str, combinations: List[Dict[str, float]],
+                    fee_bps: float, periods_per_year: float, workers: int = BACKTEST_WORKERS) -> List[dict]:
+    """
+    Evaluate ``combinations`` over ``columns`` and return their metrics in
+    the same order, using up to ``workers`` processes.
+    """
+    loop = asyncio.get_running_loop()
+    if workers <= 1 or len(combinations) < BACKTEST_MIN_PARALLEL_COMBINATIONS:
+        return await loop.run_in_executor(
+            None, run_combinations, columns, strategy_name, combinations, fee_bps, periods_per_year
+        )
+
+    shm = _share(columns)
+    try:
+        # A few chunks per worker evens out combinations of unequal cost
+        chunk_size = max(1, math.ceil(len(combinations) / (workers * 4)))
+        executor = _get_executor(workers)
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(
+                executor, _run_chunk, shm.name, len(columns["close"]), strategy_name,
+                combinations[i:i + chunk_size], fee_bps, periods_per_year
+            )
+            for i in range(0, len(combinations), chunk_size)
+        ))
+    finally:
+        shm.close()
+        shm.unlink()
+    return [metrics for part in parts for metrics in part]
+
+def _random_walk(length: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, length)))
+    spread = np.abs(rng.normal(0, 0.0005, length)) * close
+    return {
+        "open": np.concatenate(([close[0]], close[:-1])),
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+        "volume": rng.integers(100, 10000, length).astype("f8"),
+    }
+
+async def benchmark(length: int = 100_000, fast: int = 20, slow: int = 20):
+    """Bars evaluated per second with one process and with every core."""
+    columns = _random_walk(length)
+    grid = {"fast": list(range(5, 5 + fast)), "slow": list(range(30, 30 + 5 * slow, 5))}
+    combinations = expand_grid("sma_crossover", grid)
+    periods = bars_per_year(60)
+    print(f"sma_crossover sweep: {len(combinations)} combinations x {length} bars")
+    for workers in sorted({1, BACKTEST_WORKERS}):
+        if workers > 1:
+            # Start the pool outside the timing
+            await run_sweep(columns, "sma_crossover", combinations[:workers * 4], 1.0, periods, workers)
+        start = time.perf_counter()
+        await run_sweep(columns, "sma_crossover", combinations, 1.0, periods, workers)
+        elapsed = time.perf_counter() - start
+        print(f"  {workers} process(es): {elapsed:.2f}s, {len(combinations) * length / elapsed:,.0f} bars/s")
+    shutdown_executor()
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(*(int(arg) for arg in sys.argv[1:])))
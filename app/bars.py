@@ -0,0 +1,204 @@
+"""
+Recent tick and bar history per symbol, kept in memory for the dashboard
+charts.
+
+Every symbol seen on the market data hub gets a ring buffer of raw trades
+and one of OHLCV bars for each timeframe in TIMEFRAMES. The buffers are
+fixed-size NumPy structured arrays allocated once, so appending is O(1) and
+never reallocates, and ``window(n)`` returns the latest n records as a
+contiguous view without copying. Each trade is folded into the current bar
+of every timeframe as it arrives, which rolls 1s bars up into 1m and 5m bars
+without ever rescanning history.
+
+Only symbols that some client is streaming are fed by the hub, so history
+starts when the first viewer subscribes.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+BAR_STORE_MAX_SYMBOLS = int(os.getenv("BAR_STORE_MAX_SYMBOLS", "200"))
+BAR_STORE_TICK_CAPACITY = int(os.getenv("BAR_STORE_TICK_CAPACITY", "5000"))
+
+# Timeframe name -> (bar length in seconds, bars kept per symbol)
+TIMEFRAMES = {
+    "1s": (1, int(os.getenv("BAR_STORE_1S_CAPACITY", "3600"))),  # One hour
+    "1m": (60, int(os.getenv("BAR_STORE_1M_CAPACITY", "1440"))),  # One day
+    "5m": (300, int(os.getenv("BAR_STORE_5M_CAPACITY", "2016"))),  # One week
+}
+
+# Bar times are the bar's open in epoch seconds; tick times keep fractions
+BAR_DTYPE = np.dtype([
+    ("time", "i8"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+])
+TICK_DTYPE = np.dtype([
+    ("time", "f8"),
+    ("price", "f8"),
+    ("size", "f8"),
+])
+
+class RingBuffer:
+    """
+    Fixed-capacity ring of records of ``dtype``.
+
+    Every record is written twice, at slot i and i + capacity, so the latest
+    n records always form one contiguous slice of the backing array and
+    windows can be handed out as views. This costs twice the memory of a
+    plain ring but keeps reads copy-free.
+    """
+
+    def __init__(self, dtype: np.dtype, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.size = 0
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+        self._next = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, record: tuple):
+        i = self._next
+        self._data[i] = record
+        self._data[i + self.capacity] = record
+        self._next = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def update_last(self, record: tuple):
+        """Overwrite the newest record, e.g. the bar still being built."""
+        if not self.size:
+            raise IndexError("update_last on an empty ring buffer")
+        i = (self._next - 1) % self.capacity
+        self._data[i] = record
+        self._data[i + self.capacity] = record
+
+    def window(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        The latest ``n`` records (all of them by default), oldest first, as a
+        read-only view. Later appends overwrite it in place, so copy it
+        before holding on to it.
+        """
+        n = self.size if n is None else max(0, min(n, self.size))
+        end = self._next + self.capacity
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+class BarSeries:
+    """OHLCV bars of one timeframe, built incrementally from trades."""
+
+    def __init__(self, seconds: int, capacity: int):
+        self.seconds = seconds
+        self.bars = RingBuffer(BAR_DTYPE, capacity)
+        self._current: Optional[list] = None  # [time, open, high, low, close, volume]
+
+    def add_trade(self, timestamp: float, price: float, size: float) -> bool:
+        """
+        Fold a trade into its bar. Returns False for trades older than the
+        current bar, which has already been published and is not reopened.
+        """
+        start = int(timestamp // self.seconds) * self.seconds
+        bar = self._current
+        if bar is None or start > bar[0]:
+            bar = self._current = [start, price, price, price, price, size]
+            self.bars.append(tuple(bar))
+            return True
+        if start < bar[0]:
+            return False
+        if price > bar[2]:
+            bar[2] = price
+        if price < bar[3]:
+            bar[3] = price
+        bar[4] = price
+        bar[5] += size
+        self.bars.update_last(tuple(bar))
+        return True
+
+class SymbolHistory:
+    def __init__(self, tick_capacity: int = BAR_STORE_TICK_CAPACITY):
+        self.ticks = RingBuffer(TICK_DTYPE, tick_capacity)
+        self.series: Dict[str, BarSeries] = {
+            name: BarSeries(seconds, capacity) for name, (seconds, capacity) in TIMEFRAMES.items()
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return self.ticks.nbytes + sum(series.bars.nbytes for series in self.series.values())
+
+    def add_trade(self, timestamp: float, price: float, size: float):
+        self.ticks.append((timestamp, price, size))
+        for series in self.series.values():
+            series.add_trade(timestamp, price, size)
+
+def _trade_time(tick: dict) -> float:
+    timestamp = tick.get("timestamp")
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if timestamp:
+        try:
+            return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return tick.get("received_at") or time.time()
+
+class BarStore:
+    """
+    Histories for up to ``max_symbols`` symbols; the symbol that has gone
+    longest without a trade is dropped to make room for a new one.
+    """
+
+    def __init__(self, max_symbols: int = BAR_STORE_MAX_SYMBOLS):
+        self.max_symbols = max_symbols
+        self.trades_received = 0
+        self._histories: "OrderedDict[str, SymbolHistory]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(history.nbytes for history in self._histories.values())
+
+    def get(self, symbol: str) -> Optional[SymbolHistory]:
+        return self._histories.get(symbol)
+
+    def add_trade(self, symbol: str, timestamp: float, price: float, size: float):
+        history = self._histories.get(symbol)
+        if history is None:
+            history = self._histories[symbol] = SymbolHistory()
+            if len(self._histories) > self.max_symbols:
+                self._histories.popitem(last=False)
+        else:
+            self._histories.move_to_end(symbol)
+        history.add_trade(timestamp, price, size)
+        self.trades_received += 1
+
+    def on_tick(self, tick: dict):
+        """Market data hub listener; quotes are ignored."""
+        if tick.get("type") != "trade":
+            return
+        self.add_trade(tick["symbol"], _trade_time(tick), float(tick["price"]), float(tick.get("size") or 0))
+
+    def stats(self) -> dict:
+        return {"symbols": len(self._histories), "bytes": self.nbytes, "trades_received": self.trades_received}
+
+store = BarStore()
@@ -0,0 +1,72 @@
+"""
+Bar store benchmark.
+
+``python -m app.benchmarks.bars [trades]`` prints the memory one symbol
+takes at the configured capacities and the cost of the hot paths: a ring
+buffer append, folding a trade into the tick ring and every timeframe,
+the hub listener (including timestamp parsing) and ``window(500)``.
+"""
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ..bars import BAR_STORE_TICK_CAPACITY, TICK_DTYPE, TIMEFRAMES, BarStore, RingBuffer, SymbolHistory
+
+def _per_call(statement, number: int) -> float:
+    """Best-of-five seconds per call of ``statement``."""
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number
+
+def benchmark(trades: int = 200_000):
+    history = SymbolHistory()
+    print(f"Memory per symbol: {history.nbytes:,} bytes")
+    print(f"  ticks   {BAR_STORE_TICK_CAPACITY:>6} records  {history.ticks.nbytes:>9,} bytes")
+    for name, (_, capacity) in TIMEFRAMES.items():
+        print(f"  {name:<7} {capacity:>6} bars     {history.series[name].bars.nbytes:>9,} bytes")
+
+    rng = np.random.default_rng(0)
+    start = time.time()
+    # Roughly 50 trades a second, so every timeframe rolls over regularly
+    times = (start + np.cumsum(rng.exponential(0.02, trades))).tolist()
+    prices = (100 + np.cumsum(rng.normal(0, 0.01, trades))).tolist()
+    sizes = rng.integers(1, 500, trades).astype(float).tolist()
+
+    ring = RingBuffer(TICK_DTYPE, BAR_STORE_TICK_CAPACITY)
+    record = (start, 100.0, 1.0)
+    append = _per_call(lambda: ring.append(record), trades)
+
+    trade_iter = iter(range(trades))
+
+    def fold():
+        i = next(trade_iter)
+        history.add_trade(times[i], prices[i], sizes[i])
+
+    fold_cost = _per_call(fold, trades // 5)
+
+    store = BarStore()
+    ticks = [
+        {
+            "type": "trade",
+            "symbol": "BENCH",
+            "price": price,
+            "size": size,
+            "timestamp": datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z"),
+        }
+        for timestamp, price, size in zip(times, prices, sizes)
+    ]
+    tick_iter = iter(ticks)
+    on_tick = _per_call(lambda: store.on_tick(next(tick_iter)), trades // 5)
+
+    bars = history.series["1s"].bars
+    window = _per_call(lambda: bars.window(500), 100_000)
+
+    print("Per operation:")
+    print(f"  ring append                  {append * 1e6:6.2f} us")
+    print(f"  trade into ticks + {len(TIMEFRAMES)} series  {fold_cost * 1e6:6.2f} us  ({1 / fold_cost:,.0f} trades/s)")
+    print(f"  hub tick (ISO timestamp)     {on_tick * 1e6:6.2f} us  ({1 / on_tick:,.0f} ticks/s)")
+    print(f"  window(500), no copy         {window * 1e6:6.2f} us")
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,75 @@
+"""
+Response compression benchmark.
+
+``python -m app.benchmarks.compression [repeat]`` pushes a 500-row user page
+and a 20,000-row streamed NDJSON export through ``CompressionMiddleware``
+and reports bytes on the wire and CPU time per response for identity, gzip
+levels 1, 6 and 9 and brotli.
+"""
+import asyncio
+import json
+import sys
+import time
+
+from starlette.types import Message, Receive, Scope, Send
+
+from ..compression import COMPRESSION_BROTLI_QUALITY, CompressionMiddleware
+
+def _sample_users(start: int, count: int) -> list:
+    # Shaped like the rows of /manage/users
+    return [
+        {
+            "email": f"user{i}@example.com",
+            "username": f"user{i}",
+            "id": i,
+            "is_active": i % 7 != 0,
+            "role_id": 3,
+            "created_at": f"2024-03-{i % 28 + 1:02d}T12:{i % 60:02d}:{i % 59:02d}",
+            "updated_at": None,
+        }
+        for i in range(start, start + count)
+    ]
+
+async def _send_through(chunks: list, media_type: str, accept_encoding: str, **options) -> int:
+    """Bytes sent for one response made of ``chunks``, compressed with ``options``."""
+    async def app(scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", media_type.encode())]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    sent = 0
+
+    async def send(message: Message):
+        nonlocal sent
+        sent += len(message.get("body", b""))
+
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    await CompressionMiddleware(app, **options)(scope, None, send)
+    return sent
+
+async def benchmark(repeat: int = 10):
+    """Response size and compression CPU time per encoding and level."""
+    page = [json.dumps(_sample_users(0, 500)).encode()]
+    # The export streams one chunk per batch of 500 users
+    export = [
+        "".join(json.dumps(user) + "\n" for user in _sample_users(start, 500)).encode()
+        for start in range(0, 20_000, 500)
+    ]
+    settings = [("identity", "identity", {})]
+    settings += [(f"gzip {level}", "gzip", {"gzip_level": level}) for level in (1, 6, 9)]
+    settings.append((f"br {COMPRESSION_BROTLI_QUALITY}", "br", {"brotli_quality": COMPRESSION_BROTLI_QUALITY}))
+
+    for name, chunks, media_type in (
+        ("user page, 500 rows (JSON)", page, "application/json"),
+        ("user export, 20,000 rows (NDJSON)", export, "application/x-ndjson"),
+    ):
+        print(f"{name}: {sum(map(len, chunks)):,} bytes")
+        for label, encoding, options in settings:
+            start = time.process_time()
+            for _ in range(repeat):
+                sent = await _send_through(chunks, media_type, encoding, **options)
+            cpu = (time.process_time() - start) / repeat
+            print(f"  {label:<8} {sent:>11,} bytes  {cpu * 1000:8.2f} ms CPU")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(*(int(arg) for arg in sys.argv[1:])))
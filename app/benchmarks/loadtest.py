@@ -0,0 +1,103 @@
+"""
+Load test of the authenticated pages with either database engine mode.
+
+``python -m app.benchmarks.loadtest [concurrency seconds]`` runs the app
+in-process twice, once on a sync SQLite URL (sessions run in the
+threadpool) and once on sqlite+aiosqlite (AsyncSession), each against a
+scratch database seeded with SEED_USERS users. For /dashboard and /manage/users it reports
+throughput, latency percentiles and failed requests at the given
+concurrency. Every mode runs in its own process because the engine is
+chosen from DATABASE_URL at import time.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MODES = {
+    "sync": "sqlite:///{}",
+    "async": "sqlite+aiosqlite:///{}",
+}
+PATHS = ("/dashboard", "/manage/users")
+SEED_USERS = 200
+ADMIN = {"email": "loadtest@example.com", "username": "loadtest", "password": "loadtest-password"}
+
+async def _hammer(client, path: str, concurrency: int, seconds: float) -> dict:
+    latencies = []
+    failures = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal failures
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50, p99 = (latencies[min(len(latencies) - 1, int(q * len(latencies)))] for q in (0.5, 0.99))
+    return {"rps": len(latencies) / elapsed, "p50": p50, "p99": p99, "failures": failures}
+
+async def _run(mode: str, concurrency: int, seconds: float):
+    # Imported here, after benchmark() has set DATABASE_URL for this process
+    import httpx
+    from sqlalchemy import insert
+    from .. import models
+    from ..database import session_scope
+    from ..main import app
+
+    async with app.router.lifespan_context(app):
+        # Server errors are counted as failed requests instead of raised
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            # The first registered user becomes the superadmin
+            response = await client.post("/register", json=ADMIN)
+            response.raise_for_status()
+            response = await client.post(
+                "/login", data={"username": ADMIN["username"], "password": ADMIN["password"]}, follow_redirects=False
+            )
+            client.cookies.set("access_token", response.cookies["access_token"])
+            async with session_scope() as db:
+                await db.execute(insert(models.User), [
+                    {"email": f"user{i}@example.com", "username": f"user{i}", "hashed_password": "", "role_id": 3}
+                    for i in range(SEED_USERS - 1)
+                ])
+                await db.commit()
+
+            for path in PATHS:
+                # Warm the principal and role caches outside the timing
+                (await client.get(path)).raise_for_status()
+                result = await _hammer(client, path, concurrency, seconds)
+                print(
+                    f"  {mode:<5} {path:<14} {result['rps']:7.1f} req/s  p50 {result['p50'] * 1000:7.1f} ms"
+                    f"  p99 {result['p99'] * 1000:7.1f} ms  failed {result['failures']}",
+                    flush=True
+                )
+
+def benchmark(concurrency: int = 200, seconds: float = 10):
+    """Run the load test once per engine mode, each in a fresh process."""
+    print(f"{concurrency} concurrent clients for {seconds}s per page, {SEED_USERS} users:", flush=True)
+    for mode, url in MODES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, "DATABASE_URL": url.format(Path(tmp) / "loadtest.db")}
+            subprocess.run(
+                [sys.executable, "-m", "app.benchmarks.loadtest", "--mode", mode, str(concurrency), str(seconds)],
+                env=env,
+                stdout=sys.stdout,
+                check=True
+            )
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--mode"]:
+        asyncio.run(_run(args[1], int(args[2]), float(args[3])))
+    else:
+        benchmark(*(float(arg) if i else int(arg) for i, arg in enumerate(args)))
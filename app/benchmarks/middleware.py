@@ -0,0 +1,101 @@
+"""
+Authentication middleware benchmark.
+
+``python -m app.benchmarks.middleware [requests]`` calls a trivial endpoint
+directly over ASGI bare, behind the decorator-based auth middleware that
+``AuthMiddleware`` replaced (reproduced below as a BaseHTTPMiddleware), and
+behind ``AuthMiddleware``. It also times the old startswith scan over the
+public paths against ``compile_path_matcher``.
+"""
+import asyncio
+import sys
+import time
+import timeit
+
+from jose import JWTError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp
+
+from .. import auth
+from ..middleware import AuthMiddleware, compile_path_matcher
+# The removed middleware's public path list; not used by the app
+_OLD_PUBLIC_PATHS = [
+    "/", "/login", "/register", "/token", "/static", "/docs", "/openapi.json", "/redoc",
+    "/auth/google/login", "/auth/google/callback"
+]
+
+async def _old_auth_middleware(request: Request, call_next):
+    # The removed @app.middleware("http") function, which ran as a BaseHTTPMiddleware
+    request.state.user = None
+    access_token = request.cookies.get("access_token") or request.headers.get("authorization")
+    token_valid = False
+    if access_token and access_token.startswith("Bearer "):
+        try:
+            request.state.user = await auth.get_principal_from_token(access_token)
+            token_valid = request.state.user is not None
+        except JWTError:
+            pass
+    if any(request.url.path.startswith(path) for path in _OLD_PUBLIC_PATHS):
+        return await call_next(request)
+    if not token_valid:
+        return PlainTextResponse("Not authenticated", status_code=401)
+    return await call_next(request)
+
+async def _time_requests(app: ASGIApp, path: str, requests: int) -> float:
+    """Mean seconds per request for ``app`` called directly over ASGI."""
+    def receiver():
+        # The empty request body, then a disconnect once the response is sent
+        messages = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+        async def receive():
+            return next(messages, {"type": "http.disconnect"})
+        return receive
+
+    async def send(message):
+        pass
+
+    def scope():
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1),
+            "server": ("localhost", 80),
+        }
+
+    for _ in range(requests // 10):
+        await app(scope(), receiver(), send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope(), receiver(), send)
+    return (time.perf_counter() - start) / requests
+
+async def benchmark(requests: int = 20_000):
+    """Per-request middleware overhead and public-path check cost."""
+    from ..main import PUBLIC_PATHS, PUBLIC_PATH_PREFIXES
+
+    endpoint = PlainTextResponse("ok")
+    is_public = compile_path_matcher(PUBLIC_PATHS, PUBLIC_PATH_PREFIXES)
+    apps = {
+        "no middleware": endpoint,
+        "BaseHTTPMiddleware (old)": BaseHTTPMiddleware(endpoint, dispatch=_old_auth_middleware),
+        "AuthMiddleware": AuthMiddleware(endpoint, is_public, lambda request: PlainTextResponse("", 401)),
+    }
+    # Anonymous requests to a public page, so no token is decoded
+    print(f"GET /login, {requests} anonymous requests:")
+    for name, app in apps.items():
+        print(f"  {name:<26} {await _time_requests(app, '/login', requests) * 1e6:7.1f} us/request")
+
+    paths = ["/", "/login", "/dashboard", "/manage/users", "/static/css/app.css", "/backtests/17"]
+    checks = {
+        "any(startswith) (old)": lambda: [any(path.startswith(p) for p in _OLD_PUBLIC_PATHS) for path in paths],
+        "compile_path_matcher": lambda: [is_public(path) for path in paths],
+    }
+    print(f"Public path check over {len(paths)} paths:")
+    for name, check in checks.items():
+        seconds = min(timeit.repeat(check, number=20_000, repeat=5)) / 20_000 / len(paths)
+        print(f"  {name:<26} {seconds * 1e9:7.0f} ns/path")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+class VersionCounter:
+    """
+    Cross-worker invalidation signal backed by a small local file.
+
+    Each bump atomically replaces the file, so readers only need a stat()
+    call to notice that another worker (or this one) changed the data.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def current(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def bump(self):
+        try:
+            value = int(self.path.read_text() or 0) + 1
+        except (FileNotFoundError, ValueError):
+            value = 1
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(str(value))
+        os.replace(tmp_path, self.path)
+
+class KeyedVersionCounter:
+    """
+    One VersionCounter per key, each a file in ``directory``.
+
+    Bumping a key only invalidates data tagged with that key's version.
+    File names are hashes, so any string can be used as a key.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def counter(self, key) -> VersionCounter:
+        name = hashlib.sha256(str(key).encode()).hexdigest()[:32]
+        return VersionCounter(self.directory / f"{name}.version")
+
+    def current(self, key):
+        return self.counter(key).current()
+
+    def bump(self, key):
+        self.counter(key).bump()
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after ``ttl`` seconds.
+    Safe to share between the event loop and threadpool dependencies.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return None if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses
+        }
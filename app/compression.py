@@ -0,0 +1,174 @@
+"""
+Response compression.
+
+``CompressionMiddleware`` compresses response bodies with brotli or gzip,
+according to the client's Accept-Encoding. Small bodies, responses that are already encoded and
+media types that do not compress (images, archives, ...) are passed through
+untouched. Streaming responses are compressed chunk by chunk and flushed
+after every chunk, so clients still see rows as they are produced.
+"""
+import os
+import zlib
+from functools import partial
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .assets import accepted_encodings
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Media types that are already compressed; matched by prefix
+EXCLUDED_MEDIA_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-7z-compressed",
+    "application/octet-stream",
+    "text/event-stream",
+)
+# Vector images are plain text and compress well
+INCLUDED_MEDIA_TYPES = ("image/svg+xml",)
+
+class _GzipEncoder:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+class _BrotliEncoder:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+def _select_encoder(accept_encoding: str):
+    accepted = accepted_encodings(accept_encoding)
+    if "br" in accepted:
+        return _BrotliEncoder
+    if "gzip" in accepted:
+        return _GzipEncoder
+    return None
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", ""):
+        return False
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type.startswith(INCLUDED_MEDIA_TYPES):
+        return True
+    return not media_type.startswith(EXCLUDED_MEDIA_TYPES)
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing eligible HTTP responses."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {_GzipEncoder: gzip_level, _BrotliEncoder: brotli_quality}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # HEAD bodies are empty, so their Content-Length must stay untouched
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoder_class = _select_encoder(Headers(scope=scope).get("accept-encoding", ""))
+        if encoder_class is None:
+            await self.app(scope, receive, send)
+            return
+        encoder_factory = partial(encoder_class, self.levels[encoder_class])
+        responder = _CompressionResponder(self.app, encoder_factory, self.minimum_size)
+        await responder(scope, receive, send)
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoder_factory, minimum_size: int):
+        self.app = app
+        self.encoder_factory = encoder_factory
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Held back until the first body chunk shows how large it is
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = message["status"] in (204, 206, 304) or not is_compressible(headers)
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                self.start_message = None
+                await self.send(message)
+                return
+            self.encoder = self.encoder_factory()
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoder.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            # The compressed body is a different representation of the same
+            # resource, so a strong validator must become a weak one
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                message["body"] = self.encoder.compress(body)
+            else:
+                message["body"] = self.encoder.finish(body)
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.start_message)
+            self.start_message = None
+            await self.send(message)
+            return
+
+        message["body"] = self.encoder.compress(body) if more_body else self.encoder.finish(body)
+        await self.send(message)
@@ -0,0 +1,118 @@
+import asyncio
+import base64
+import json
+import os
+import re
+import time
+from typing import Optional
+
+import httpx
+from google.auth import jwt as google_jwt
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Google OAuth 2.0 endpoints (overridable to point at a local stub server)
+AUTHORIZATION_ENDPOINT = os.getenv("GOOGLE_AUTHORIZATION_ENDPOINT", "https://accounts.google.com/o/oauth2/v2/auth")
+TOKEN_ENDPOINT = os.getenv("GOOGLE_TOKEN_ENDPOINT", "https://oauth2.googleapis.com/token")
+USERINFO_ENDPOINT = os.getenv("GOOGLE_USERINFO_ENDPOINT", "https://www.googleapis.com/oauth2/v3/userinfo")
+CERTS_ENDPOINT = os.getenv("GOOGLE_CERTS_ENDPOINT", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+
+GOOGLE_HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "10"))
+# Used when the certs response carries no usable Cache-Control max-age
+DEFAULT_CERTS_MAX_AGE = 3600
+
+_client: Optional[httpx.AsyncClient] = None
+_certs = {}
+_certs_expires_at = 0.0
+_certs_lock = asyncio.Lock()
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Shared client for all Google calls, so TLS connections are pooled and
+    kept alive across callbacks instead of being opened per request.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=GOOGLE_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def exchange_code(code: str, client_id: str, client_secret: str, redirect_uri: str) -> dict:
+    """Exchange an authorization code for Google's token response."""
+    response = await get_http_client().post(
+        TOKEN_ENDPOINT,
+        data={
+            'code': code,
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code'
+        }
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def fetch_userinfo(access_token: str) -> dict:
+    response = await get_http_client().get(
+        USERINFO_ENDPOINT,
+        headers={'Authorization': f'Bearer {access_token}'}
+    )
+    response.raise_for_status()
+    return response.json()
+
+def _max_age(cache_control: str) -> int:
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return int(match.group(1)) if match else DEFAULT_CERTS_MAX_AGE
+
+async def get_certs(force_refresh: bool = False) -> dict:
+    """
+    Return Google's signing certificates, cached for as long as the
+    response's Cache-Control max-age allows. Concurrent callers share a
+    single refresh.
+    """
+    global _certs, _certs_expires_at
+    if not force_refresh and _certs and time.monotonic() < _certs_expires_at:
+        return _certs
+    async with _certs_lock:
+        # Another caller may have refreshed while we waited for the lock
+        if not force_refresh and _certs and time.monotonic() < _certs_expires_at:
+            return _certs
+        response = await get_http_client().get(CERTS_ENDPOINT)
+        response.raise_for_status()
+        _certs = response.json()
+        max_age = _max_age(response.headers.get("cache-control", ""))
+        _certs_expires_at = time.monotonic() + max_age
+        return _certs
+
+def _token_key_id(token: str) -> Optional[str]:
+    header = token.split(".")[0]
+    header += "=" * (-len(header) % 4)
+    return json.loads(base64.urlsafe_b64decode(header)).get("kid")
+
+async def verify_id_token(token: str, audience: str) -> dict:
+    """
+    Verify a Google ID token against the cached certificates.
+    Certificates are refetched once if the token uses an unknown key id,
+    which happens when Google rotates its keys.
+    """
+    certs = await get_certs()
+    if _token_key_id(token) not in certs:
+        certs = await get_certs(force_refresh=True)
+
+    id_info = google_jwt.decode(token, certs=certs, audience=audience)
+    if id_info.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+    return id_info
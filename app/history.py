@@ -0,0 +1,257 @@
+"""
+Local cache of historical OHLCV bars.
+
+Bars downloaded from Alpaca are kept under HISTORY_DIR (next to the SQLite
+database by default), one directory per (timeframe, symbol, UTC day):
+
+    HISTORY_DIR/1m/AAPL/2024-03-01/meta.json
+    HISTORY_DIR/1m/AAPL/2024-03-01/close-<version>.npy
+    ...
+
+Every column of a day is its own .npy file, memory-mapped on read, so a
+range read only touches the pages it needs and costs little more than the
+mmap calls. The files stay ordinary .npy files that np.load can open.
+
+``meta.json`` records which parts of the day have been fetched (empty
+weekends and holidays included) and the version of the column files; a
+request for a range therefore only downloads the missing parts.
+
+Writers produce a new version of the column files and then atomically
+replace ``meta.json``, so readers in other workers always see a consistent
+day. Two workers filling the same day at once can at worst drop each
+other's coverage, which only causes a refetch. Only bars that have closed
+are cached; the bar still being built is served live by ``bars.store``.
+"""
+import asyncio
+import json
+import mmap
+import os
+import time
+import weakref
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from . import alpaca
+from .bars import BAR_DTYPE
+from .database import DATA_DIR
+
+# Load environment variables
+load_dotenv()
+
+HISTORY_DIR = Path(os.getenv("HISTORY_DIR", DATA_DIR / "history"))
+HISTORY_MAX_DAYS = int(os.getenv("HISTORY_MAX_DAYS", "366"))  # Longest range served per request
+# Bars newer than this may still be missing upstream (IEX latency, the
+# 15 minute SIP delay), so they are refetched until they are older
+HISTORY_SETTLE_SECONDS = int(os.getenv("HISTORY_SETTLE_SECONDS", "900"))
+
+# Timeframe name -> (bar length in seconds, Alpaca timeframe)
+TIMEFRAMES = {
+    "1m": (60, "1Min"),
+    "5m": (300, "5Min"),
+    "15m": (900, "15Min"),
+    "1h": (3600, "1Hour"),
+    "1d": (86400, "1Day"),
+}
+
+COLUMNS = BAR_DTYPE.names
+DAY = 86400
+
+Interval = Tuple[int, int]  # [start, end) in epoch seconds
+
+def _merge(intervals: List[Interval]) -> List[Interval]:
+    """Sort and join overlapping or touching intervals."""
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def _subtract(start: int, end: int, covered: List[Interval]) -> List[Interval]:
+    gaps = []
+    for covered_start, covered_end in covered:
+        if covered_end <= start or covered_start >= end:
+            continue
+        if covered_start > start:
+            gaps.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+def _days(start: int, end: int) -> range:
+    """Epoch seconds of every UTC midnight whose day overlaps [start, end)."""
+    return range(start // DAY * DAY, end, DAY)
+
+def _isoformat(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _bars_to_columns(raw_bars: list) -> Dict[str, np.ndarray]:
+    columns = {
+        "time": np.fromiter(
+            (datetime.fromisoformat(bar["t"].replace("Z", "+00:00")).timestamp() for bar in raw_bars),
+            dtype="i8",
+            count=len(raw_bars)
+        )
+    }
+    for column, key in (("open", "o"), ("high", "h"), ("low", "l"), ("close", "c"), ("volume", "v")):
+        columns[column] = np.fromiter((bar[key] for bar in raw_bars), dtype="f8", count=len(raw_bars))
+    return columns
+
+def _map_column(path: Path, dtype: np.dtype, offset: int, rows: int) -> np.ndarray:
+    # np.load(mmap_mode="r") parses the .npy header on every call; mapping
+    # at the data offset recorded in meta.json is several times faster
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mapped, dtype=dtype, count=rows, offset=offset)
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {column: np.empty(0, dtype=BAR_DTYPE[column]) for column in COLUMNS}
+
+class HistoryCache:
+    def __init__(self, root: Path = HISTORY_DIR):
+        self.root = Path(root)
+        # One lock per (symbol, timeframe) while a request holds or waits for
+        # it; entries disappear with the last reference
+        self._locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.stats = {"hits": 0, "fetches": 0, "bars_fetched": 0}
+
+    def _day_dir(self, symbol: str, timeframe: str, day: int) -> Path:
+        return self.root / timeframe / symbol / time.strftime("%Y-%m-%d", time.gmtime(day))
+
+    def _read_meta(self, day_dir: Path) -> Optional[dict]:
+        try:
+            with open(day_dir / "meta.json") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _load_day(self, day_dir: Path, retries: int = 3) -> Tuple[Optional[dict], Dict[str, np.ndarray]]:
+        meta = self._read_meta(day_dir)
+        if meta is None or not meta["rows"]:
+            return meta, _empty_columns()
+        try:
+            columns = {
+                column: _map_column(
+                    day_dir / f"{column}-{meta['version']}.npy", BAR_DTYPE[column], meta["offsets"][column], meta["rows"]
+                )
+                for column in COLUMNS
+            }
+        except FileNotFoundError:
+            # Replaced by another worker between reading meta and the columns
+            if not retries:
+                raise
+            return self._load_day(day_dir, retries - 1)
+        return meta, columns
+
+    def missing(self, symbol: str, timeframe: str, start: int, end: int) -> List[Interval]:
+        """Parts of [start, end) that have not been fetched yet."""
+        gaps = []
+        for day in _days(start, end):
+            meta = self._read_meta(self._day_dir(symbol, timeframe, day))
+            covered = [tuple(interval) for interval in meta["covered"]] if meta else []
+            gaps.extend(_subtract(max(start, day), min(end, day + DAY), covered))
+        return _merge(gaps)
+
+    def read(self, symbol: str, timeframe: str, start: int, end: int) -> Dict[str, np.ndarray]:
+        """
+        Cached bars with open times in [start, end), one array per column.
+        A range within a single day is returned as read-only memory-mapped
+        slices; longer ranges are concatenated into new arrays.
+        """
+        parts = []
+        for day in _days(start, end):
+            _, columns = self._load_day(self._day_dir(symbol, timeframe, day))
+            times = columns["time"]
+            if not len(times):
+                continue
+            lo, hi = np.searchsorted(times, (start, end))
+            if hi > lo:
+                parts.append({column: values[lo:hi] for column, values in columns.items()})
+        if not parts:
+            return _empty_columns()
+        if len(parts) == 1:
+            return parts[0]
+        return {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+
+    def store(self, symbol: str, timeframe: str, start: int, end: int, bars: Dict[str, np.ndarray],
+              covered_end: Optional[int] = None):
+        """
+        Merge freshly fetched ``bars`` for [start, end) into the day files,
+        replacing any cached bars with the same open time. Only
+        [start, covered_end) is recorded as fetched (all of it by default).
+        """
+        covered_end = end if covered_end is None else min(covered_end, end)
+        for day in _days(start, end):
+            day_dir = self._day_dir(symbol, timeframe, day)
+            day_dir.mkdir(parents=True, exist_ok=True)
+            meta, old = self._load_day(day_dir)
+            meta = meta or {"version": None, "rows": 0, "covered": []}
+
+            lo, hi = np.searchsorted(bars["time"], (day, day + DAY))
+            # Fresh bars go first so np.unique keeps them over cached duplicates
+            combined = {column: np.concatenate([bars[column][lo:hi], old[column]]) for column in COLUMNS}
+            _, keep = np.unique(combined["time"], return_index=True)
+
+            # Unique per writer, so workers storing the same day at once never
+            # overwrite each other's column files
+            version = f"{time.time_ns():x}-{os.getpid()}"
+            offsets = {}
+            for column in COLUMNS:
+                path = day_dir / f"{column}-{version}.npy"
+                values = combined[column][keep]
+                np.save(path, values)
+                offsets[column] = path.stat().st_size - values.nbytes
+            covered = _merge(
+                [tuple(interval) for interval in meta["covered"]] + [(max(start, day), min(covered_end, day + DAY))]
+            )
+            tmp_path = day_dir / f"meta.json.{os.getpid()}.tmp"
+            tmp_path.write_text(json.dumps({
+                "version": version, "rows": len(keep), "offsets": offsets, "covered": covered
+            }))
+            os.replace(tmp_path, day_dir / "meta.json")
+            if meta["version"] is not None:
+                # Readers that already mapped the old version keep their mapping
+                for column in COLUMNS:
+                    (day_dir / f"{column}-{meta['version']}.npy").unlink(missing_ok=True)
+
+    async def get_bars(self, symbol: str, timeframe: str, start: int, end: int) -> Dict[str, np.ndarray]:
+        """
+        Bars with open times in [start, end), downloading only the ranges
+        that are not cached yet. ``end`` is capped at the open of the bar
+        currently being built. Alpaca publishes recent bars late, so the
+        last HISTORY_SETTLE_SECONDS are stored but not marked as fetched
+        and are downloaded again by the next request.
+        """
+        seconds, alpaca_timeframe = TIMEFRAMES[timeframe]
+        end = min(end, int(time.time()) // seconds * seconds)
+        if start >= end:
+            return _empty_columns()
+
+        lock = self._locks.setdefault((symbol, timeframe), asyncio.Lock())
+        async with lock:
+            gaps = await run_in_threadpool(self.missing, symbol, timeframe, start, end)
+            if not gaps:
+                self.stats["hits"] += 1
+            for gap_start, gap_end in gaps:
+                raw_bars = await alpaca.get_client().get_bars(
+                    symbol, alpaca_timeframe, _isoformat(gap_start), _isoformat(gap_end - 1)
+                )
+                self.stats["fetches"] += 1
+                self.stats["bars_fetched"] += len(raw_bars)
+                bars = _bars_to_columns(raw_bars)
+                order = np.argsort(bars["time"], kind="stable")
+                bars = {column: values[order] for column, values in bars.items()}
+                settled = int(time.time()) - HISTORY_SETTLE_SECONDS
+                await run_in_threadpool(self.store, symbol, timeframe, gap_start, gap_end, bars, settled)
+        return await run_in_threadpool(self.read, symbol, timeframe, start, end)
+
+cache = HistoryCache()
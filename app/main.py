@@ -1,11 +1,14 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse
-from . import models, auth
-from .database import engine, init_db, dispose_engine
-from .routers import auth_router, user_router, dashboard_router
+from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse, PlainTextResponse
+from fastapi.exception_handlers import http_exception_handler as default_http_exception_handler
+from . import models, auth, google_oauth, metrics, profiling, alpaca, market_data, bars, history
+from .assets import PrecompressedStaticFiles
+from .compression import CompressionMiddleware, COMPRESSION_ENABLED
+from .middleware import AuthMiddleware, compile_path_matcher
+from .database import init_db_async, dispose_engine_async, engine
+from .templating import templates, precompile_templates, cached_template_response, page_cache
+from .routers import auth_router, user_router, dashboard_router, backtest_router
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.exceptions import HTTPException as StarletteHTTPException
 import os
@@ -13,23 +16,36 @@ from dotenv import load_dotenv
 import json
 from typing import Callable, Optional
 from contextlib import asynccontextmanager
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database import get_db
 
 # Load environment variables
 load_dotenv()
 
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
 # Lifespan context manager for startup and shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize database
     print("Initializing database...")
-    init_db()
+    await init_db_async()
+    print("Compiling templates...")
+    precompile_templates()
+    await alpaca.start_client()
     yield
     # Shutdown: Cleanup
     print("Cleaning up...")
-    dispose_engine()
+    await market_data.hub.stop()
+    await backtest_router.shutdown()
+    auth.shutdown_hash_executor()
+    await google_oauth.close_http_client()
+    await alpaca.close_client()
+    await dispose_engine_async()
+
+# Build chart history from every trade the market data hub receives
+market_data.hub.add_listener(bars.store.on_tick)
 
 # Create FastAPI application
 app = FastAPI(
@@ -38,11 +54,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-
-# Templates
-templates = Jinja2Templates(directory="app/templates")
+# Mount static files (serves precompressed, fingerprinted builds from
+# `python -m app.assets` when present)
+app.mount("/static", PrecompressedStaticFiles(directory="app/static"), name="static")
 
 # CORS middleware
 allowed_origins = json.loads(os.getenv("ALLOWED_ORIGINS", '["http://localhost:8000"]'))
@@ -62,44 +76,43 @@ app.add_middleware(
     https_only=os.getenv("COOKIE_SECURE", "False").lower() == "true"
 )
 
+# Response compression (brotli or gzip)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # Root route handler
 @app.get("/", response_class=HTMLResponse)
 async def root(
     request: Request,
     access_token: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # Try to get access token from cookie
-    if not access_token:
-        access_token = request.cookies.get("access_token")
-
-    # Try to get user information if logged in
-    user = None
-    is_admin = False
-    is_superadmin = False
-    
-    if access_token:
+    # The auth middleware has already resolved the cookie; an explicit
+    # access_token query parameter is still honoured
+    user = getattr(request.state, "user", None)
+    if access_token and user is None:
         try:
-            token = access_token.replace("Bearer ", "")
-            payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-            username = payload.get("sub")
-            if username:
-                user = db.query(models.User).filter(models.User.username == username).first()
-                if user:
-                    user.role = db.query(models.Role).filter(models.Role.id == user.role_id).first()
-                    is_admin = user.is_admin()
-                    is_superadmin = user.is_superadmin()
+            user = await auth.get_principal_from_token(access_token, db)
         except JWTError:
             pass
 
-    # Always render index.html, but with user info if available
+    # Anonymous visitors all get the same page
+    if user is None:
+        return cached_template_response(
+            request,
+            "index.html",
+            {"user": None, "is_admin": False, "is_superadmin": False},
+            key=("anonymous",)
+        )
+
+    # Render index.html with the user's info
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
             "user": user,
-            "is_admin": is_admin,
-            "is_superadmin": is_superadmin
+            "is_admin": user.is_admin(),
+            "is_superadmin": user.is_superadmin()
         }
     )
 
@@ -107,43 +120,98 @@ async def root(
 app.include_router(auth_router.router, tags=["authentication"])
 app.include_router(user_router.router, tags=["users"])
 app.include_router(dashboard_router.router, tags=["dashboard"])
+app.include_router(backtest_router.router, tags=["backtests"])
 
-# List of paths that don't require authentication
+# Paths that don't require authentication. "/" is public on its own; the
+# prefixes also cover everything below them.
 PUBLIC_PATHS = [
     "/",
     "/login",
+    "/logout",
     "/register",
     "/token",
-    "/static",
-    "/docs",
     "/openapi.json",
-    "/redoc",
     "/auth/google/login",
     "/auth/google/callback"
 ]
+if METRICS_ENABLED:
+    # Scraped without credentials; restrict access at the proxy if needed
+    PUBLIC_PATHS.append("/metrics")
+PUBLIC_PATH_PREFIXES = [
+    "/static",
+    "/docs",
+    "/redoc"
+]
 
-@app.middleware("http")
-async def auth_middleware(request: Request, call_next):
-    # Check if the path is public
-    if any(request.url.path.startswith(path) for path in PUBLIC_PATHS):
-        response = await call_next(request)
-        return response
-
-    # Get token from cookie
-    access_token = request.cookies.get("access_token")
-    
-    if not access_token or not access_token.startswith("Bearer "):
-        # If it's an API request, return JSON response
-        if request.headers.get("accept") == "application/json":
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Not authenticated"}
-            )
-        # Otherwise redirect to login page
-        return RedirectResponse(url="/login")
+def _unauthenticated_response(request: Request):
+    # If it's an API request, return JSON response
+    if request.headers.get("accept") == "application/json":
+        return JSONResponse(
+            status_code=401,
+            content={"detail": "Not authenticated"}
+        )
+    # Otherwise redirect to login page
+    return RedirectResponse(url="/login")
+
+# Sampled profiling and the slow request log; registered before the auth
+# middleware so it runs inside it and can see request.state.user
+if profiling.SLOW_REQUEST_THRESHOLD > 0:
+    profiling.instrument_engine(engine)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Authentication middleware; handlers read request.state.user
+app.add_middleware(
+    AuthMiddleware,
+    is_public=compile_path_matcher(PUBLIC_PATHS, PUBLIC_PATH_PREFIXES),
+    on_unauthenticated=_unauthenticated_response
+)
+
+def _collect_app_stats():
+    hash_stats = auth.get_hash_pool_stats()
+    yield "password_hash_in_flight", "gauge", "Password hash operations running or queued.", {(): hash_stats["in_flight"]}
+    yield "password_hash_queued", "gauge", "Password hash operations waiting for a worker.", {(): hash_stats["queued"]}
+    yield "password_hash_rejected_total", "counter", "Password hash operations rejected with 503.", {(): hash_stats["rejected"]}
+
+    caches = {"token": auth.token_cache, "principal": auth.principal_cache, "page": page_cache}
+    cache_stats = {name: cache.stats() for name, cache in caches.items()}
+    for stat, metric_type, documentation in (
+        ("hits", "counter", "Cache lookups that found a live entry."),
+        ("misses", "counter", "Cache lookups that missed."),
+        ("size", "gauge", "Entries currently cached."),
+    ):
+        yield f"cache_{stat}" + ("_total" if metric_type == "counter" else ""), metric_type, documentation, {
+            (("cache", name),): stats[stat] for name, stats in cache_stats.items()
+        }
+
+    hub_stats = market_data.hub.stats()
+    lags = [subscriber["lag_ms"] / 1000 for subscriber in hub_stats["subscribers"]]
+    yield "market_data_subscribers", "gauge", "Clients streaming market data.", {(): len(lags)}
+    yield "market_data_symbols", "gauge", "Symbols subscribed upstream.", {(): len(hub_stats["symbols"])}
+    yield "market_data_ticks_total", "counter", "Ticks received from the upstream feed.", {(): hub_stats["ticks_received"]}
+    yield "market_data_max_client_lag_seconds", "gauge", "Largest lag of a streaming client at its last delivery.", {(): max(lags, default=0)}
+
+    bar_stats = bars.store.stats()
+    yield "bar_store_symbols", "gauge", "Symbols with in-memory tick and bar history.", {(): bar_stats["symbols"]}
+    yield "bar_store_bytes", "gauge", "Bytes allocated for in-memory tick and bar history.", {(): bar_stats["bytes"]}
+    history_stats = history.cache.stats
+    yield "history_cache_hits_total", "counter", "History reads served without downloading.", {(): history_stats["hits"]}
+    yield "history_cache_fetches_total", "counter", "Missing history ranges downloaded from Alpaca.", {(): history_stats["fetches"]}
+    yield "history_cache_bars_fetched_total", "counter", "Bars downloaded into the history cache.", {(): history_stats["bars_fetched"]}
+
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        yield "db_pool_checked_out", "gauge", "Pooled connections currently in use.", {(): pool.checkedout()}
+        yield "db_pool_overflow", "gauge", "Connections open beyond the pool size.", {(): max(0, pool.overflow())}
+
+# Metrics; added last so the timings cover every other middleware
+if METRICS_ENABLED:
+    metrics.instrument_engine(engine)
+    metrics.add_collector(_collect_app_stats)
+    app.add_middleware(metrics.MetricsMiddleware)
 
-    response = await call_next(request)
-    return response
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Error handlers
 @app.exception_handler(StarletteHTTPException)
@@ -177,7 +245,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
                 content={"detail": "Not authenticated"}
             )
         return RedirectResponse(url="/login")
-    return await http_exception_handler(request, exc)
+    return await default_http_exception_handler(request, exc)
 
 @app.exception_handler(auth.JWTError)
 async def jwt_error_handler(request: Request, exc: auth.JWTError):
@@ -0,0 +1,377 @@
+"""
+Market data hub.
+
+The hub keeps one upstream feed connection for the union of the symbols
+browser clients are watching and fans each tick out to them. Every client
+holds at most one pending tick per (symbol, type): a newer tick replaces an
+undelivered older one, so a slow consumer receives the latest prices late
+instead of an ever-growing backlog. Per-client lag and conflation counts are
+available from ``hub.stats()``.
+
+Feeds:
+* ``AlpacaStreamFeed`` - Alpaca's market data WebSocket stream (trades and
+  quotes), re-subscribed in place as the symbol set changes.
+* ``ReplayFeed`` - replays an NDJSON file of ticks, or generates a random
+  walk when no file is given; for local testing without market access.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import websockets
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from .alpaca import ALPACA_API_KEY, ALPACA_SECRET_KEY
+
+# Load environment variables
+load_dotenv()
+
+MARKET_DATA_FEED = os.getenv("MARKET_DATA_FEED", "alpaca")  # alpaca or replay
+ALPACA_DATA_STREAM_URL = os.getenv("ALPACA_DATA_STREAM_URL", "wss://stream.data.alpaca.markets/v2/iex")
+MARKET_DATA_REPLAY_FILE = os.getenv("MARKET_DATA_REPLAY_FILE", "")
+MARKET_DATA_REPLAY_SPEED = float(os.getenv("MARKET_DATA_REPLAY_SPEED", "1"))
+MARKET_DATA_REPLAY_RATE = float(os.getenv("MARKET_DATA_REPLAY_RATE", "10"))  # Generated ticks per second per symbol
+MARKET_DATA_MAX_SYMBOLS = int(os.getenv("MARKET_DATA_MAX_SYMBOLS", "50"))  # Per client
+
+SYMBOL_PATTERN = re.compile(r"[A-Z][A-Z0-9.]{0,9}")
+RECONNECT_MAX_DELAY = 30.0
+STREAM_AUTH_TIMEOUT = 10.0
+# Auth failed (402) and connection limit exceeded (406) will not clear up
+# on an immediate retry
+STREAM_SLOW_RETRY_CODES = {402, 406}
+
+logger = logging.getLogger(__name__)
+
+def parse_symbols(value: str) -> FrozenSet[str]:
+    """
+    Parse a comma separated symbol list. Raises ValueError for malformed
+    symbols, an empty list or more than MARKET_DATA_MAX_SYMBOLS symbols.
+    """
+    symbols = frozenset(symbol.strip().upper() for symbol in value.split(",") if symbol.strip())
+    if not symbols:
+        raise ValueError("No symbols given")
+    if len(symbols) > MARKET_DATA_MAX_SYMBOLS:
+        raise ValueError(f"At most {MARKET_DATA_MAX_SYMBOLS} symbols can be streamed")
+    invalid = sorted(symbol for symbol in symbols if not SYMBOL_PATTERN.fullmatch(symbol))
+    if invalid:
+        raise ValueError(f"Invalid symbols: {', '.join(invalid)}")
+    return symbols
+
+class Subscriber:
+    """One client's view of the stream with a conflating pending buffer."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, symbols: FrozenSet[str]):
+        self.id = next(self._ids)
+        self.symbols = symbols
+        self.connected_at = time.time()
+        self.delivered = 0
+        self.conflated = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._pending: Dict[Tuple[str, str], dict] = {}
+        self._ready = asyncio.Event()
+
+    def offer(self, tick: dict):
+        key = (tick["symbol"], tick["type"])
+        if key in self._pending:
+            self.conflated += 1
+        self._pending[key] = tick
+        self._ready.set()
+
+    async def next_batch(self) -> List[dict]:
+        """Wait for and return the latest pending tick of each symbol and type."""
+        await self._ready.wait()
+        self._ready.clear()
+        batch = list(self._pending.values())
+        self._pending = {}
+        if batch:
+            self.lag = time.time() - min(tick["received_at"] for tick in batch)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.delivered += len(batch)
+        return batch
+
+    def stats(self) -> dict:
+        return {
+            "id": self.id,
+            "symbols": sorted(self.symbols),
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+            "delivered": self.delivered,
+            "conflated": self.conflated,
+            "pending": len(self._pending),
+            "lag_ms": round(self.lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2)
+        }
+
+class MarketDataHub:
+    def __init__(self, feed_factory: Callable[[], "Feed"]):
+        self.feed_factory = feed_factory
+        self.feed: Optional[Feed] = None
+        self.ticks_received = 0
+        self._by_symbol: Dict[str, Set[Subscriber]] = {}
+        self._listeners: List[Callable[[dict], None]] = []
+        self._feed_task: Optional[asyncio.Task] = None
+
+    @property
+    def symbols(self) -> FrozenSet[str]:
+        return frozenset(self._by_symbol)
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Call ``listener`` synchronously with every tick received."""
+        self._listeners.append(listener)
+
+    # Subscribing and unsubscribing never await, so a client that is
+    # cancelled mid-disconnect cannot leave the hub half updated
+    def subscribe(self, symbols: Iterable[str]) -> Subscriber:
+        subscriber = Subscriber(frozenset(symbols))
+        for symbol in subscriber.symbols:
+            self._by_symbol.setdefault(symbol, set()).add(subscriber)
+        self._sync_feed()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for symbol in subscriber.symbols:
+            watchers = self._by_symbol.get(symbol)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self._by_symbol[symbol]
+        self._sync_feed()
+
+    def publish(self, tick: dict):
+        tick["received_at"] = time.time()
+        self.ticks_received += 1
+        for listener in self._listeners:
+            listener(tick)
+        for subscriber in self._by_symbol.get(tick["symbol"], ()):
+            subscriber.offer(tick)
+
+    def _sync_feed(self):
+        # One upstream connection for the union of every client's symbols,
+        # opened with the first subscriber and closed with the last
+        symbols = self.symbols
+        if not symbols:
+            if self._feed_task is not None:
+                self._feed_task.cancel()
+                self._feed_task = None
+                self.feed = None
+        elif self._feed_task is None or self._feed_task.done():
+            self.feed = self.feed_factory()
+            self._feed_task = asyncio.create_task(self.feed.run(self, symbols))
+        else:
+            self.feed.set_symbols(symbols)
+
+    async def stop(self):
+        """Close the upstream feed; called from the app lifespan."""
+        task = self._feed_task
+        self._by_symbol.clear()
+        self._sync_feed()
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        subscribers = {subscriber for watchers in self._by_symbol.values() for subscriber in watchers}
+        return {
+            "feed": self.feed.__class__.__name__ if self.feed else None,
+            "symbols": sorted(self.symbols),
+            "ticks_received": self.ticks_received,
+            "subscribers": sorted((subscriber.stats() for subscriber in subscribers), key=lambda s: s["id"])
+        }
+
+class Feed:
+    async def run(self, hub: MarketDataHub, symbols: FrozenSet[str]):
+        raise NotImplementedError
+
+    def set_symbols(self, symbols: FrozenSet[str]):
+        """Change the streamed symbols; applied by the running feed."""
+        raise NotImplementedError
+
+def _normalize_alpaca_message(message: dict) -> Optional[dict]:
+    kind = message.get("T")
+    if kind == "t":
+        return {
+            "type": "trade",
+            "symbol": message["S"],
+            "price": message["p"],
+            "size": message["s"],
+            "timestamp": message["t"]
+        }
+    if kind == "q":
+        return {
+            "type": "quote",
+            "symbol": message["S"],
+            "bid": message["bp"],
+            "bid_size": message["bs"],
+            "ask": message["ap"],
+            "ask_size": message["as"],
+            "timestamp": message["t"]
+        }
+    return None
+
+class AlpacaStreamError(ConnectionError):
+    def __init__(self, code: Optional[int], message: Optional[str]):
+        super().__init__(f"Alpaca stream error {code}: {message}")
+        self.code = code
+
+def _raise_for_error(message: dict):
+    if message.get("T") == "error":
+        raise AlpacaStreamError(message.get("code"), message.get("msg"))
+
+class AlpacaStreamFeed(Feed):
+    """Alpaca market data stream; reconnects with backoff and resubscribes."""
+
+    def __init__(self, url: str = ALPACA_DATA_STREAM_URL):
+        self.url = url
+        self.symbols: FrozenSet[str] = frozenset()
+        self._symbols_changed = asyncio.Event()
+
+    async def run(self, hub: MarketDataHub, symbols: FrozenSet[str]):
+        self.symbols = symbols
+        if not (ALPACA_API_KEY and ALPACA_SECRET_KEY):
+            logger.error("ALPACA_API_KEY and ALPACA_SECRET_KEY are not set; not connecting to the market data stream")
+            return
+        attempt = 0
+        while True:
+            delay = None
+            try:
+                async with websockets.connect(self.url) as connection:
+                    await asyncio.wait_for(self._authenticate(connection), STREAM_AUTH_TIMEOUT)
+                    subscriptions = asyncio.create_task(self._maintain_subscriptions(connection))
+                    try:
+                        async for raw in connection:
+                            for message in json.loads(raw):
+                                _raise_for_error(message)
+                                if message.get("T") == "subscription":
+                                    # Authenticated and subscribed, so the
+                                    # connection is healthy again
+                                    attempt = 0
+                                tick = _normalize_alpaca_message(message)
+                                if tick is not None:
+                                    hub.publish(tick)
+                    finally:
+                        subscriptions.cancel()
+            except AlpacaStreamError as exc:
+                logger.warning("%s", exc)
+                if exc.code in STREAM_SLOW_RETRY_CODES:
+                    delay = RECONNECT_MAX_DELAY
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+                pass
+            if delay is None:
+                delay = random.uniform(0, min(RECONNECT_MAX_DELAY, 0.5 * 2 ** attempt))
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _authenticate(self, connection):
+        # Alpaca greets with "connected"; subscriptions sent before the
+        # "authenticated" reply are rejected
+        await connection.send(json.dumps(
+            {"action": "auth", "key": ALPACA_API_KEY, "secret": ALPACA_SECRET_KEY}
+        ))
+        async for raw in connection:
+            for message in json.loads(raw):
+                _raise_for_error(message)
+                if message.get("T") == "success" and message.get("msg") == "authenticated":
+                    return
+        raise ConnectionError("Alpaca stream closed during authentication")
+
+    def set_symbols(self, symbols: FrozenSet[str]):
+        self.symbols = symbols
+        self._symbols_changed.set()
+
+    async def _maintain_subscriptions(self, connection):
+        # Applies symbol changes as subscribe/unsubscribe diffs on the open
+        # connection, starting from nothing on every (re)connect
+        subscribed: FrozenSet[str] = frozenset()
+        while True:
+            symbols = self.symbols
+            removed = sorted(subscribed - symbols)
+            added = sorted(symbols - subscribed)
+            if removed:
+                await connection.send(json.dumps({"action": "unsubscribe", "trades": removed, "quotes": removed}))
+            if added:
+                await connection.send(json.dumps({"action": "subscribe", "trades": added, "quotes": added}))
+            subscribed = symbols
+            await self._symbols_changed.wait()
+            self._symbols_changed.clear()
+
+def _read_ticks(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _tick_time(tick: dict) -> float:
+    timestamp = tick.get("timestamp")
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+class ReplayFeed(Feed):
+    """
+    Replays normalized ticks from an NDJSON file in a loop, keeping their
+    original spacing divided by ``speed``. Without a file, trades following a
+    random walk are generated at ``rate`` ticks per second per symbol.
+    """
+
+    def __init__(self, path: str = MARKET_DATA_REPLAY_FILE, speed: float = MARKET_DATA_REPLAY_SPEED,
+                 rate: float = MARKET_DATA_REPLAY_RATE):
+        self.path = path
+        self.speed = speed
+        self.rate = rate
+        self.symbols: FrozenSet[str] = frozenset()
+
+    def set_symbols(self, symbols: FrozenSet[str]):
+        self.symbols = symbols
+
+    async def run(self, hub: MarketDataHub, symbols: FrozenSet[str]):
+        self.symbols = symbols
+        if self.path:
+            await self._replay_file(hub)
+        else:
+            await self._random_walk(hub)
+
+    async def _replay_file(self, hub: MarketDataHub):
+        ticks = await run_in_threadpool(_read_ticks, self.path)
+        if not ticks:
+            return
+        while True:
+            previous = None
+            for tick in ticks:
+                current = _tick_time(tick)
+                if previous is not None and current > previous:
+                    await asyncio.sleep((current - previous) / self.speed)
+                previous = current
+                if tick["symbol"] in self.symbols:
+                    hub.publish(dict(tick))
+
+    async def _random_walk(self, hub: MarketDataHub):
+        prices: Dict[str, float] = {}
+        while True:
+            symbols = sorted(self.symbols)
+            for symbol in symbols:
+                price = prices.get(symbol) or random.uniform(20, 500)
+                price = round(max(0.01, price * (1 + random.gauss(0, 0.0005))), 2)
+                prices[symbol] = price
+                hub.publish({
+                    "type": "trade",
+                    "symbol": symbol,
+                    "price": price,
+                    "size": random.randint(1, 500),
+                    "timestamp": datetime.utcnow().isoformat() + "Z"
+                })
+            await asyncio.sleep(1 / self.rate if self.rate > 0 else 1)
+
+def _default_feed() -> Feed:
+    return ReplayFeed() if MARKET_DATA_FEED == "replay" else AlpacaStreamFeed()
+
+hub = MarketDataHub(_default_feed)
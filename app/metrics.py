@@ -0,0 +1,260 @@
+"""
+Prometheus-style metrics.
+
+Counters, gauges and histograms live in plain per-worker dicts and lists.
+Updates take no locks: request metrics are only touched from the event loop
+thread, and for the few updates made from worker threads (queries, pool
+checkouts, password hashing) a rare lost increment is an acceptable price
+for staying cheap enough to leave on in production. ``render()`` produces
+the text exposition format served at /metrics.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from jinja2 import Template
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[Labels, float]]]]] = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        _metrics.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.items())
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+            for labels, value in list(self.values.items())
+        ]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.items())
+        series = self.values.get(key)
+        if series is None:
+            series = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, series in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(float(bound))))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+def add_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[Labels, float]]]]):
+    """
+    Register a callback evaluated on every scrape. It yields
+    (name, type, help, {labels: value}) tuples, for values that already
+    live elsewhere (cache hit counters, pool sizes).
+    """
+    _collectors.append(collector)
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, metric_type, documentation, values in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# HTTP
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status.")
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route."
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+http_request_db_queries = Histogram(
+    "http_request_db_queries", "Database queries issued per HTTP request.", COUNT_BUCKETS
+)
+http_request_db_seconds = Histogram(
+    "http_request_db_seconds", "Database time spent per HTTP request.", FAST_BUCKETS
+)
+
+# Database
+db_queries_total = Counter("db_queries_total", "Database statements executed.")
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds", "Database statement execution time.", FAST_BUCKETS
+)
+db_pool_checkout_wait_seconds = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.", FAST_BUCKETS
+)
+db_connect_duration_seconds = Histogram(
+    "db_connect_duration_seconds", "Time spent opening a new database connection.", FAST_BUCKETS
+)
+
+# Application
+password_hash_duration_seconds = Histogram(
+    "password_hash_duration_seconds", "bcrypt hash and verify time on the worker pool.",
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+template_render_duration_seconds = Histogram(
+    "template_render_duration_seconds", "Jinja2 template render time.", FAST_BUCKETS
+)
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+# Per-request query accounting; the object is shared with threadpool calls
+# made on behalf of the request, which run in a copy of its context
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+def _route_label(scope: Scope) -> str:
+    # Route templates keep the label set bounded ("/manage/users/{user_id}")
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("endpoint") is not None:
+        # Mounted apps (static files) are labelled with their mount path
+        return scope.get("root_path") or "/"
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route HTTP metrics."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        http_requests_in_flight.inc()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            _request_stats.reset(token)
+            method = scope["method"]
+            route = _route_label(scope)
+            http_requests_total.inc(method=method, route=route, status=str(status_code))
+            http_request_duration_seconds.observe(duration, method=method, route=route)
+            http_request_db_queries.observe(stats.queries, route=route)
+            http_request_db_seconds.observe(stats.db_seconds, route=route)
+
+def instrument_engine(engine):
+    """Record query counts and times, connect times and pool checkout waits, for ``engine``."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        db_queries_total.inc()
+        db_query_duration_seconds.observe(duration)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += duration
+
+    @event.listens_for(engine, "do_connect")
+    def _do_connect(dialect, connection_record, cargs, cparams):
+        connection_record.info["connect_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        start = connection_record.info.pop("connect_start", None)
+        if start is not None:
+            db_connect_duration_seconds.observe(time.perf_counter() - start)
+
+    # Checkout waits are reported by database.CheckoutTimingMixin pools
+    listeners = getattr(type(engine.pool), "checkout_wait_listeners", None)
+    if listeners is not None and db_pool_checkout_wait_seconds.observe not in listeners:
+        listeners.append(db_pool_checkout_wait_seconds.observe)
+
+class TimedTemplate(Template):
+    """Template class that records render time per template name."""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            template_render_duration_seconds.observe(
+                time.perf_counter() - start, template=self.name or "<string>"
+            )
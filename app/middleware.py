@@ -0,0 +1,97 @@
+"""
+Authentication middleware.
+
+``AuthMiddleware`` is a pure ASGI middleware: it resolves the access token
+from the cookie or Authorization header into ``request.state.user`` and
+rejects unauthenticated requests to non-public paths before routing,
+without the extra task and body wrapping of ``@app.middleware("http")``.
+"""
+import re
+from typing import Callable, Iterable
+
+from jose import JWTError
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import auth
+
+def compile_path_matcher(exact: Iterable[str] = (), prefixes: Iterable[str] = ()) -> Callable[[str], bool]:
+    """
+    Build a predicate for public paths.
+    ``exact`` paths match only themselves; ``prefixes`` match themselves and
+    anything below them on a segment boundary ("/static" matches
+    "/static/app.css" but not "/staticfiles").
+    """
+    exact_paths = frozenset(exact)
+    prefix_list = [prefix.rstrip("/") for prefix in prefixes]
+    if not prefix_list:
+        return exact_paths.__contains__
+
+    prefix_pattern = re.compile(
+        "(?:" + "|".join(re.escape(prefix) for prefix in sorted(prefix_list, key=len, reverse=True)) + ")(?:/|$)"
+    )
+
+    def is_public(path: str) -> bool:
+        return path in exact_paths or prefix_pattern.match(path) is not None
+
+    return is_public
+
+def _is_preflight(scope: Scope, connection: HTTPConnection) -> bool:
+    return (
+        scope["type"] == "http"
+        and scope["method"] == "OPTIONS"
+        and "origin" in connection.headers
+        and "access-control-request-method" in connection.headers
+    )
+
+class AuthMiddleware:
+    """
+    Resolve the caller's identity once per request or websocket.
+    Handlers read the principal from ``request.state.user`` (None when
+    anonymous). Requests to non-public paths without a valid token get the
+    response built by ``on_unauthenticated``; websockets are closed.
+    CORS preflights carry no credentials and are passed through for
+    CORSMiddleware, which sits inside this middleware, to answer.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        is_public: Callable[[str], bool],
+        on_unauthenticated: Callable[[Request], Response]
+    ):
+        self.app = app
+        self.is_public = is_public
+        self.on_unauthenticated = on_unauthenticated
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        if _is_preflight(scope, connection):
+            scope.setdefault("state", {})["user"] = None
+            await self.app(scope, receive, send)
+            return
+
+        user = None
+        access_token = connection.cookies.get("access_token") or connection.headers.get("authorization")
+        if access_token and access_token.startswith("Bearer "):
+            try:
+                user = await auth.get_principal_from_token(access_token)
+            except JWTError:
+                pass
+        scope.setdefault("state", {})["user"] = user
+
+        if user is not None or self.is_public(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        # Reject missing or invalid credentials before routing
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        response = self.on_unauthenticated(Request(scope, receive))
+        await response(scope, receive, send)
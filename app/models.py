@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, DateTime, JSON
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, DateTime, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -23,6 +23,15 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     role = relationship("Role", back_populates="users")
+    # Deleted explicitly with the user; never loaded implicitly
+    backtest_runs = relationship("BacktestRun", back_populates="user", passive_deletes=True)
+
+    # Composite indexes backing the keyset-paginated user listing
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_role_id_id", "role_id", "id"),
+        Index("ix_users_is_active_id", "is_active", "id"),
+    )
 
     def is_superadmin(self):
         return self.role.name == "superadmin"
@@ -40,3 +49,45 @@ class AuthSettings(Base):
     google_client_secret = Column(String, nullable=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     updated_by = Column(Integer, ForeignKey("users.id"))
+
+class BacktestRun(Base):
+    __tablename__ = "backtest_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    strategy = Column(String, nullable=False)
+    symbol = Column(String, nullable=False)
+    timeframe = Column(String, nullable=False)
+    start = Column(DateTime(timezone=True), nullable=False)
+    end = Column(DateTime(timezone=True), nullable=False)
+    parameters = Column(JSON)  # Grid of values per strategy parameter
+    fee_bps = Column(Float, default=0)
+    status = Column(String, default="running")  # running, completed or failed
+    error = Column(String, nullable=True)
+    bars = Column(Integer, nullable=True)
+    combinations = Column(Integer, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    user = relationship("User", back_populates="backtest_runs")
+    results = relationship("BacktestResult", back_populates="run", passive_deletes=True)
+
+    # Each user lists their own runs, newest first
+    __table_args__ = (
+        Index("ix_backtest_runs_user_id_id", "user_id", "id"),
+    )
+
+class BacktestResult(Base):
+    __tablename__ = "backtest_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("backtest_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    parameters = Column(JSON)  # One combination from the run's grid
+    total_return = Column(Float)
+    sharpe = Column(Float)
+    max_drawdown = Column(Float)
+    trades = Column(Integer)
+    exposure = Column(Float)
+
+    run = relationship("BacktestRun", back_populates="results")
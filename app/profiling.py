@@ -0,0 +1,178 @@
+"""
+Opt-in request profiling.
+
+``ProfilingMiddleware`` does two independent things:
+
+* Sampled profiling: a fraction of requests (or any request an admin sends
+  with ``X-Profile: 1``) is sampled by a background thread that records the
+  event loop thread's stack at a fixed interval. Each profile is written as
+  a collapsed-stack file under PROFILING_DIR/<route>/, which speedscope and
+  flamegraph.pl open directly. The loop is shared, so stacks from other
+  requests served at the same time also show up in a profile.
+* Slow request log: SQL statements executed on behalf of a request are
+  collected and logged, with their timings, when the request takes longer
+  than SLOW_REQUEST_THRESHOLD seconds.
+"""
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .database import DATA_DIR
+
+# Load environment variables
+load_dotenv()
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.005"))  # Seconds between stack samples
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", DATA_DIR / "profiles"))
+PROFILE_HEADER = "x-profile"
+
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "0"))  # Seconds; 0 disables the log
+SLOW_REQUEST_MAX_STATEMENTS = 200
+
+logger = logging.getLogger(__name__)
+
+# Statements executed for the current request: (sql, seconds)
+_request_statements: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_statements", default=None
+)
+
+def instrument_engine(engine):
+    """Collect the statements run by ``engine`` for the slow request log."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiling_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["profiling_start"].pop()
+        statements = _request_statements.get()
+        if statements is not None and len(statements) < SLOW_REQUEST_MAX_STATEMENTS:
+            statements.append((statement, duration))
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ';' separates frames in the collapsed format
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(";", ":")
+
+class StackSampler:
+    """Sample one thread's stack every ``interval`` seconds until stopped."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILING_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Signal the sampler to stop; returns without waiting for it."""
+        self._stop.set()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def _route_dirname(scope: Scope) -> str:
+    route = scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", path).strip("_") or "root"
+
+def write_profile(scope: Scope, sampler: StackSampler, duration: float) -> Path:
+    """Wait for a stopped sampler to finish and write its stacks. Blocks."""
+    sampler.join()
+    directory = PROFILING_DIR / _route_dirname(scope)
+    directory.mkdir(parents=True, exist_ok=True)
+    # The random suffix keeps profiles finished within the same second apart
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{int(duration * 1000)}ms-{uuid.uuid4().hex[:8]}"
+    path = directory / f"{name}.collapsed"
+    path.write_text(sampler.collapsed())
+    return path
+
+def _is_admin(scope: Scope) -> bool:
+    user = scope.get("state", {}).get("user")
+    return user is not None and user.is_admin()
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware for sampled profiling and the slow request log.
+    Must run inside AuthMiddleware so the profile header can be limited to
+    admins.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if Headers(scope=scope).get(PROFILE_HEADER) == "1" and _is_admin(scope):
+            return True
+        return PROFILING_ENABLED and random.random() < PROFILING_SAMPLE_RATE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sampler = None
+        if self._should_profile(scope):
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+        statements, token = None, None
+        if SLOW_REQUEST_THRESHOLD > 0:
+            statements = []
+            token = _request_statements.set(statements)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration = time.perf_counter() - start
+            if token is not None:
+                _request_statements.reset(token)
+            if sampler is not None:
+                # The sampler may be mid-sleep; wait for it off the event loop
+                sampler.stop()
+                path = await run_in_threadpool(write_profile, scope, sampler, duration)
+                logger.info("Profile for %s %s written to %s", scope["method"], scope["path"], path)
+            if token is not None and duration >= SLOW_REQUEST_THRESHOLD:
+                self._log_slow_request(scope, duration, statements)
+
+    def _log_slow_request(self, scope: Scope, duration: float, statements: List[Tuple[str, float]]):
+        db_time = sum(seconds for _, seconds in statements)
+        lines = [
+            f"Slow request: {scope['method']} {scope['path']} took {duration * 1000:.1f} ms, "
+            f"{len(statements)} statements in {db_time * 1000:.1f} ms"
+        ]
+        lines.extend(f"  [{seconds * 1000:.2f} ms] {' '.join(sql.split())}" for sql, seconds in statements)
+        logger.warning("\n".join(lines))
@@ -0,0 +1,238 @@
+"""
+Token bucket rate limiting for the credential endpoints.
+
+Every client IP has a bucket for login attempts (/login, /token) and one
+for registrations, and every username has a bucket that only failed logins
+drain. Buckets are checked before any password hashing or database work,
+so a credential-stuffing burst is answered with a cheap 429.
+
+Behind a reverse proxy every request arrives from the proxy's address, so
+list the proxies in RATE_LIMIT_TRUSTED_PROXIES: requests from them are keyed
+on the client address they report in X-Forwarded-For instead.
+
+Buckets live in process memory by default. With RATE_LIMIT_STORE=sqlite
+they are kept in a small SQLite file next to the database instead, which
+all workers on the host share.
+"""
+import ipaddress
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from .database import DATA_DIR
+
+# Load environment variables
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")  # memory or sqlite
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", str(DATA_DIR / ".ratelimit.db"))
+# Comma-separated addresses or networks of reverse proxies, e.g. 127.0.0.1,10.0.0.0/8
+RATE_LIMIT_TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "").split(",")
+    if proxy.strip()
+)
+
+@dataclass(frozen=True)
+class RateLimit:
+    per_minute: float
+    burst: float
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+LOGIN_IP_LIMIT = RateLimit(
+    per_minute=float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "30")),
+    burst=float(os.getenv("RATE_LIMIT_IP_BURST", "10"))
+)
+LOGIN_USERNAME_LIMIT = RateLimit(
+    per_minute=float(os.getenv("RATE_LIMIT_USERNAME_PER_MINUTE", "5")),
+    burst=float(os.getenv("RATE_LIMIT_USERNAME_BURST", "5"))
+)
+REGISTER_IP_LIMIT = RateLimit(
+    per_minute=float(os.getenv("RATE_LIMIT_REGISTER_PER_MINUTE", "5")),
+    burst=float(os.getenv("RATE_LIMIT_REGISTER_BURST", "5"))
+)
+
+def _refill(tokens: float, updated_at: float, limit: RateLimit, now: float) -> float:
+    return min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+def _wait_time(tokens: float, cost: float, limit: RateLimit) -> float:
+    if limit.rate <= 0:
+        return math.inf
+    return (cost - tokens) / limit.rate
+
+class MemoryStore:
+    """
+    Per-worker buckets in an LRU-bounded dict; O(1) per check. Only used
+    from the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def take(self, key: str, limit: RateLimit, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """
+        Remove ``cost`` tokens from the bucket and return 0, or return the
+        seconds until enough tokens are available. A cost of 0 only checks
+        that at least one token is left.
+        """
+        now = time.time() if now is None else now
+        bucket = self._buckets.get(key)
+        tokens = limit.burst if bucket is None else _refill(bucket[0], bucket[1], limit, now)
+        needed = cost or 1.0
+        if tokens < needed:
+            return _wait_time(tokens, needed, limit)
+        self._buckets[key] = (tokens - cost, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.maxsize:
+            # Dropping the least recently used bucket resets it to full
+            self._buckets.popitem(last=False)
+        return 0.0
+
+class SQLiteStore:
+    """
+    Buckets shared by every worker on the host through a SQLite file.
+    Each check is one short write transaction.
+    """
+
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Losing a few bucket updates in a crash is harmless
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, limit: RateLimit, cost: float = 1.0, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = limit.burst if row is None else _refill(row[0], row[1], limit, now)
+            needed = cost or 1.0
+            if tokens < needed:
+                conn.execute("COMMIT")
+                return _wait_time(tokens, needed, limit)
+            if cost:
+                conn.execute(
+                    "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (key, tokens - cost, now)
+                )
+                self._writes += 1
+                if self._writes % self.CLEANUP_EVERY == 0:
+                    # Buckets untouched for an hour are full again; drop them
+                    conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - 3600,))
+            conn.execute("COMMIT")
+            return 0.0
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = SQLiteStore() if RATE_LIMIT_STORE == "sqlite" else MemoryStore()
+    return _store
+
+async def take(key: str, limit: RateLimit, cost: float = 1.0) -> float:
+    store = get_store()
+    if isinstance(store, SQLiteStore):
+        return await run_in_threadpool(store.take, key, limit, cost)
+    return store.take(key, limit, cost)
+
+def _too_many_requests(retry_after: float):
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many attempts, please try again later",
+        headers={"Retry-After": str(max(1, math.ceil(min(retry_after, 3600))))},
+    )
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in RATE_LIMIT_TRUSTED_PROXIES)
+
+def _client_ip(request: Request) -> str:
+    """
+    The address to rate limit. For requests from a trusted proxy this is
+    the right-most X-Forwarded-For entry that is not itself a trusted
+    proxy; entries left of it are client-supplied and cannot be believed.
+    """
+    host = request.client.host if request.client else "unknown"
+    if not RATE_LIMIT_TRUSTED_PROXIES or not _is_trusted_proxy(host):
+        return host
+    forwarded = ",".join(request.headers.getlist("x-forwarded-for"))
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        if not _is_trusted_proxy(hop):
+            return hop
+        host = hop
+    return host
+
+async def _form_username(request: Request) -> Optional[str]:
+    # FastAPI has already parsed the form for the endpoint; this is cached
+    form = await request.form()
+    username = form.get("username")
+    return username.lower() if isinstance(username, str) and username else None
+
+async def throttle_login(request: Request):
+    """
+    Dependency for /login and /token. Charges the client IP for the attempt
+    and refuses usernames whose failed-login bucket is empty.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = await take(f"login-ip:{_client_ip(request)}", LOGIN_IP_LIMIT)
+    if retry_after:
+        _too_many_requests(retry_after)
+    username = await _form_username(request)
+    if username:
+        retry_after = await take(f"login-user:{username}", LOGIN_USERNAME_LIMIT, cost=0)
+        if retry_after:
+            _too_many_requests(retry_after)
+
+async def record_login_failure(username: str):
+    """Drain one token from ``username``'s bucket after a failed login."""
+    if RATE_LIMIT_ENABLED and username:
+        await take(f"login-user:{username.lower()}", LOGIN_USERNAME_LIMIT)
+
+async def throttle_register(request: Request):
+    """Dependency for /register, limited per client IP."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    retry_after = await take(f"register-ip:{_client_ip(request)}", REGISTER_IP_LIMIT)
+    if retry_after:
+        _too_many_requests(retry_after)
@@ -1,77 +1,119 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Form, Cookie
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
-from .. import models, schemas, auth
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, auth, google_oauth, ratelimit
+from ..database import get_db, DATA_DIR
+from ..cache import VersionCounter
 from datetime import timedelta
-from fastapi.templating import Jinja2Templates
-from typing import Optional
-from jose import JWTError, jwt
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-import requests
+from ..templating import cached_template_response
 from urllib.parse import urlencode
+import os
+import re
+import time
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
-# Google OAuth 2.0 endpoints
-AUTHORIZATION_ENDPOINT = 'https://accounts.google.com/o/oauth2/v2/auth'
-TOKEN_ENDPOINT = 'https://oauth2.googleapis.com/token'
-USERINFO_ENDPOINT = 'https://www.googleapis.com/oauth2/v3/userinfo'
+# Auth settings cache
+# The settings row changes rarely, so a read-only snapshot is kept per worker.
+# Updates bump a version file next to the database which every worker checks
+# on each lookup; the TTL bounds staleness if the file is changed externally.
+AUTH_SETTINGS_CACHE_TTL = float(os.getenv("AUTH_SETTINGS_CACHE_TTL", "60"))
+auth_settings_version = VersionCounter(DATA_DIR / ".auth_settings.version")
+_auth_settings_cache = {"settings": None, "version": None, "expires_at": 0.0}
 
-async def get_auth_settings(db: Session):
-    settings = db.query(models.AuthSettings).first()
+async def get_auth_settings(db: AsyncSession) -> schemas.AuthSettings:
+    version = auth_settings_version.current()
+    cached = _auth_settings_cache["settings"]
+    if (
+        cached is not None
+        and _auth_settings_cache["version"] == version
+        and time.monotonic() < _auth_settings_cache["expires_at"]
+    ):
+        return cached
+
+    settings = await db.scalar(select(models.AuthSettings))
     if not settings:
         settings = models.AuthSettings(
             regular_auth_enabled=True,
             google_auth_enabled=False
         )
         db.add(settings)
-        db.commit()
-        db.refresh(settings)
-    return settings
+        await db.commit()
+        await db.refresh(settings)
+
+    snapshot = schemas.AuthSettings.model_validate(settings)
+    _auth_settings_cache.update(
+        settings=snapshot,
+        version=version,
+        expires_at=time.monotonic() + AUTH_SETTINGS_CACHE_TTL
+    )
+    return snapshot
+
+def invalidate_auth_settings():
+    """Drop the cached settings here and signal the other workers."""
+    _auth_settings_cache["settings"] = None
+    auth_settings_version.bump()
+
+USERNAME_ALLOCATION_ATTEMPTS = 5
+
+async def allocate_username(db: AsyncSession, base_username: str) -> str:
+    """
+    Return ``base_username`` or the first free ``base_username<N>`` (N >= 1)
+    using a single prefix range query over the username index.
+    """
+    taken = (await db.scalars(
+        select(models.User.username).where(
+            models.User.username >= base_username,
+            models.User.username < base_username + "\uffff"
+        )
+    )).all()
+    suffix_pattern = re.compile(re.escape(base_username) + r"(\d*)")
+    used = set()
+    for name in taken:
+        match = suffix_pattern.fullmatch(name)
+        if match:
+            used.add(int(match.group(1)) if match.group(1) else 0)
+    if 0 not in used:
+        return base_username
+    counter = 1
+    while counter in used:
+        counter += 1
+    return f"{base_username}{counter}"
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(
     request: Request,
-    access_token: Optional[str] = Cookie(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # If user is already logged in, redirect to dashboard
-    if access_token:
-        try:
-            token = access_token.replace("Bearer ", "")
-            payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-            username = payload.get("sub")
-            if username:
-                user = db.query(models.User).filter(models.User.username == username).first()
-                if user:
-                    return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
-        except JWTError:
-            pass
+    if getattr(request.state, "user", None):
+        return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
 
     # Get auth settings
     settings = await get_auth_settings(db)
     
-    return templates.TemplateResponse(
+    # Anonymous output only depends on the auth settings snapshot
+    return cached_template_response(
+        request,
         "login.html",
         {
-            "request": request,
             "user": None,
             "is_admin": False,
             "is_superadmin": False,
             "regular_auth_enabled": settings.regular_auth_enabled,
             "google_auth_enabled": settings.google_auth_enabled,
             "google_client_id": settings.google_client_id if settings.google_auth_enabled else None
-        }
+        },
+        key=(settings, "anonymous")
     )
 
 @router.get("/auth/google/login")
 async def google_login(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if Google auth is enabled
     settings = await get_auth_settings(db)
@@ -96,14 +138,14 @@ async def google_login(
     
     # Redirect to Google's OAuth page
     return RedirectResponse(
-        f'{AUTHORIZATION_ENDPOINT}?{urlencode(params)}'
+        f'{google_oauth.AUTHORIZATION_ENDPOINT}?{urlencode(params)}'
     )
 
 @router.get("/auth/google/callback")
 async def google_callback(
     request: Request,
     code: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if Google auth is enabled
     settings = await get_auth_settings(db)
@@ -118,61 +160,56 @@ async def google_callback(
         callback_url = str(request.base_url)[:-1] + "/auth/google/callback"
 
         # Exchange authorization code for tokens
-        token_response = requests.post(
-            TOKEN_ENDPOINT,
-            data={
-                'code': code,
-                'client_id': settings.google_client_id,
-                'client_secret': settings.google_client_secret,
-                'redirect_uri': callback_url,
-                'grant_type': 'authorization_code'
-            }
+        token_data = await google_oauth.exchange_code(
+            code,
+            settings.google_client_id,
+            settings.google_client_secret,
+            callback_url
         )
-        token_response.raise_for_status()
-        token_data = token_response.json()
 
         # Verify the ID token
-        id_info = id_token.verify_oauth2_token(
+        id_info = await google_oauth.verify_id_token(
             token_data['id_token'],
-            google_requests.Request(),
             settings.google_client_id
         )
 
         # Get user info
-        user_info_response = requests.get(
-            USERINFO_ENDPOINT,
-            headers={'Authorization': f'Bearer {token_data["access_token"]}'}
-        )
-        user_info_response.raise_for_status()
-        user_info = user_info_response.json()
+        user_info = await google_oauth.fetch_userinfo(token_data["access_token"])
 
         # Check if user exists
-        user = db.query(models.User).filter(models.User.email == user_info['email']).first()
+        user = await db.scalar(select(models.User).where(models.User.email == user_info['email']))
         if not user:
-            # Create new user
-            username = user_info['email'].split('@')[0]
-            base_username = username
-            counter = 1
-            while db.query(models.User).filter(models.User.username == username).first():
-                username = f"{base_username}{counter}"
-                counter += 1
-
             # Get default role
-            user_role = db.query(models.Role).filter(models.Role.name == "user").first()
+            user_role = await db.scalar(select(models.Role).where(models.Role.name == "user"))
             if not user_role:
                 user_role = models.Role(name="user")
                 db.add(user_role)
-                db.commit()
-
-            user = models.User(
-                email=user_info['email'],
-                username=username,
-                hashed_password="",  # No password for Google auth users
-                role_id=user_role.id
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+                await db.commit()
+                auth.invalidate_roles()
+
+            # Create new user; the unique constraints arbitrate races between
+            # workers, so a conflicting insert is retried with a fresh name
+            base_username = user_info['email'].split('@')[0]
+            for _ in range(USERNAME_ALLOCATION_ATTEMPTS):
+                user = models.User(
+                    email=user_info['email'],
+                    username=await allocate_username(db, base_username),
+                    hashed_password="",  # No password for Google auth users
+                    role_id=user_role.id
+                )
+                db.add(user)
+                try:
+                    await db.commit()
+                    break
+                except IntegrityError:
+                    await db.rollback()
+                    # A concurrent callback may have created this account
+                    user = await db.scalar(select(models.User).where(models.User.email == user_info['email']))
+                    if user:
+                        break
+            else:
+                raise RuntimeError("Could not allocate a unique username")
+            await db.refresh(user)
 
         # Create access token
         access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -199,41 +236,32 @@ async def google_callback(
 @router.get("/register", response_class=HTMLResponse)
 async def register_page(
     request: Request,
-    access_token: Optional[str] = Cookie(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # If user is already logged in, redirect to dashboard
-    if access_token:
-        try:
-            token = access_token.replace("Bearer ", "")
-            payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-            username = payload.get("sub")
-            if username:
-                user = db.query(models.User).filter(models.User.username == username).first()
-                if user:
-                    return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
-        except JWTError:
-            pass
+    if getattr(request.state, "user", None):
+        return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
 
     # Get auth settings
     settings = await get_auth_settings(db)
     if not settings.regular_auth_enabled:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
 
-    return templates.TemplateResponse(
+    return cached_template_response(
+        request,
         "register.html",
         {
-            "request": request,
             "user": None,
             "is_admin": False,
             "is_superadmin": False
-        }
+        },
+        key=("anonymous",)
     )
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(ratelimit.throttle_login)])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if regular auth is enabled
     settings = await get_auth_settings(db)
@@ -243,8 +271,9 @@ async def login_for_access_token(
             detail="Regular authentication is disabled"
         )
 
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        await ratelimit.record_login_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -256,10 +285,10 @@ async def login_for_access_token(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@router.post("/register", response_model=schemas.User)
+@router.post("/register", response_model=schemas.User, dependencies=[Depends(ratelimit.throttle_register)])
 async def register_user(
     user: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if regular auth is enabled
     settings = await get_auth_settings(db)
@@ -270,15 +299,16 @@ async def register_user(
         )
 
     # Check if user exists
-    db_user = db.query(models.User).filter(
+    db_user = await db.scalar(select(models.User).where(
         (models.User.email == user.email) | 
         (models.User.username == user.username)
-    ).first()
+    ))
     if db_user:
         raise HTTPException(status_code=400, detail="Email or username already registered")
     
-    # Create new user
-    hashed_password = auth.get_password_hash(user.password)
+    # Create new user (release the pooled connection while bcrypt runs)
+    await db.commit()
+    hashed_password = await auth.get_password_hash_async(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -286,35 +316,36 @@ async def register_user(
     )
     
     # Check if this is the first user (make them superadmin)
-    first_user = db.query(models.User).first() is None
+    first_user = await db.scalar(select(models.User.id).limit(1)) is None
     if first_user:
         # Create roles if they don't exist
         roles = ["superadmin", "admin", "user"]
         for role_name in roles:
-            db_role = db.query(models.Role).filter(models.Role.name == role_name).first()
+            db_role = await db.scalar(select(models.Role).where(models.Role.name == role_name))
             if not db_role:
                 db_role = models.Role(name=role_name)
                 db.add(db_role)
-        db.commit()
+        await db.commit()
+        auth.invalidate_roles()
         
         # Assign superadmin role to first user
-        superadmin_role = db.query(models.Role).filter(models.Role.name == "superadmin").first()
+        superadmin_role = await db.scalar(select(models.Role).where(models.Role.name == "superadmin"))
         db_user.role_id = superadmin_role.id
     else:
         # Assign default user role
-        user_role = db.query(models.Role).filter(models.Role.name == "user").first()
+        user_role = await db.scalar(select(models.Role).where(models.Role.name == "user"))
         db_user.role_id = user_role.id
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(ratelimit.throttle_login)])
 async def login(
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if regular auth is enabled
     settings = await get_auth_settings(db)
@@ -324,8 +355,9 @@ async def login(
             detail="Regular authentication is disabled"
         )
 
-    user = auth.authenticate_user(db, username, password)
+    user = await auth.authenticate_user(db, username, password)
     if not user:
+        await ratelimit.record_login_failure(username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -0,0 +1,169 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from .. import models, schemas, auth, alpaca, backtest, history
+from ..database import get_db, session_scope
+from ..market_data import SYMBOL_PATTERN
+from .dashboard_router import get_current_user_from_cookie
+from datetime import timedelta, timezone
+from typing import List, Optional, Set
+import asyncio
+import logging
+import os
+import time
+
+router = APIRouter(prefix="/backtests")
+
+BACKTEST_MAX_DAYS = int(os.getenv("BACKTEST_MAX_DAYS", "3660"))
+MAX_PAGE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+# Sweeps run after the create request has returned; clients poll the run
+_running: Set[asyncio.Task] = set()
+
+def _as_utc(value):
+    # Naive datetimes are taken as UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+async def _execute(run_id: int, run: schemas.BacktestCreate, combinations: List[dict]):
+    started = time.perf_counter()
+    try:
+        seconds, _ = history.TIMEFRAMES[run.timeframe]
+        columns = await history.cache.get_bars(
+            run.symbol, run.timeframe, int(run.start.timestamp()), int(run.end.timestamp())
+        )
+        if len(columns["close"]) < 2:
+            raise ValueError("Not enough bars in the requested range")
+        results = await backtest.run_sweep(
+            columns, run.strategy, combinations, run.fee_bps, backtest.bars_per_year(seconds)
+        )
+        async with session_scope() as db:
+            await db.execute(
+                insert(models.BacktestResult),
+                [{"run_id": run_id, "parameters": params, **metrics} for params, metrics in zip(combinations, results)]
+            )
+            await db.execute(
+                update(models.BacktestRun)
+                .where(models.BacktestRun.id == run_id)
+                .values(
+                    status="completed",
+                    bars=len(columns["close"]),
+                    duration_seconds=time.perf_counter() - started,
+                    completed_at=func.now()
+                )
+            )
+            await db.commit()
+    except asyncio.CancelledError:
+        await _mark_failed(run_id, "Interrupted by server shutdown", started)
+        raise
+    except (ValueError, alpaca.AlpacaError) as exc:
+        await _mark_failed(run_id, exc.message if isinstance(exc, alpaca.AlpacaError) else str(exc), started)
+    except Exception as exc:
+        logger.exception("Backtest run %s failed", run_id)
+        await _mark_failed(run_id, str(exc) or exc.__class__.__name__, started)
+
+async def _mark_failed(run_id: int, error: str, started: float):
+    async with session_scope() as db:
+        await db.execute(
+            update(models.BacktestRun)
+            .where(models.BacktestRun.id == run_id)
+            .values(
+                status="failed",
+                error=error,
+                duration_seconds=time.perf_counter() - started,
+                completed_at=func.now()
+            )
+        )
+        await db.commit()
+
+async def shutdown():
+    """Cancel sweeps still running; called from the app lifespan."""
+    for task in list(_running):
+        task.cancel()
+    await asyncio.gather(*_running, return_exceptions=True)
+    backtest.shutdown_executor()
+
+@router.get("/strategies")
+async def list_strategies(current_user: auth.Principal = Depends(get_current_user_from_cookie)):
+    return {
+        name: {"description": strategy.description, "parameters": strategy.defaults}
+        for name, strategy in backtest.STRATEGIES.items()
+    }
+
+@router.post("", response_model=schemas.BacktestRun, status_code=status.HTTP_202_ACCEPTED)
+async def create_backtest(
+    run: schemas.BacktestCreate,
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    run.symbol = run.symbol.upper()
+    run.start, run.end = _as_utc(run.start), _as_utc(run.end)
+    if not SYMBOL_PATTERN.fullmatch(run.symbol):
+        raise HTTPException(status_code=400, detail=f"Invalid symbol: {run.symbol}")
+    if run.timeframe not in history.TIMEFRAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown timeframe, expected one of: {', '.join(history.TIMEFRAMES)}"
+        )
+    if run.start >= run.end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if run.end - run.start > timedelta(days=BACKTEST_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Backtests are limited to {BACKTEST_MAX_DAYS} days")
+    try:
+        combinations = backtest.expand_grid(run.strategy, run.parameters)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    db_run = models.BacktestRun(
+        user_id=current_user.id,
+        strategy=run.strategy,
+        symbol=run.symbol,
+        timeframe=run.timeframe,
+        start=run.start,
+        end=run.end,
+        parameters=run.parameters,
+        fee_bps=run.fee_bps,
+        status="running",
+        combinations=len(combinations)
+    )
+    db.add(db_run)
+    await db.commit()
+    await db.refresh(db_run)
+
+    task = asyncio.create_task(_execute(db_run.id, run, combinations))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return db_run
+
+@router.get("", response_model=List[schemas.BacktestRun])
+async def list_backtests(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[int] = Query(None, description="Only runs with a smaller id, for paging"),
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    query = select(models.BacktestRun).where(models.BacktestRun.user_id == current_user.id)
+    if before is not None:
+        query = query.where(models.BacktestRun.id < before)
+    return (await db.scalars(query.order_by(models.BacktestRun.id.desc()).limit(limit))).all()
+
+@router.get("/{run_id}", response_model=schemas.BacktestRunDetail)
+async def get_backtest(
+    run_id: int,
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    # Other users' runs are reported as missing
+    db_run = await db.scalar(
+        select(models.BacktestRun)
+        .options(selectinload(models.BacktestRun.results))
+        .where(models.BacktestRun.id == run_id, models.BacktestRun.user_id == current_user.id)
+    )
+    if db_run is None:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+    detail = schemas.BacktestRunDetail.model_validate(db_run)
+    # Best first; runs whose Sharpe ratio overflowed go last
+    detail.results.sort(key=lambda result: (result.sharpe is not None, result.sharpe or 0), reverse=True)
+    return detail
@@ -1,47 +1,30 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, Cookie
-from sqlalchemy.orm import Session
-from .. import models, auth
+from fastapi import APIRouter, Depends, Query, Request, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, auth, alpaca, bars, history
 from ..database import get_db
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from ..market_data import hub, parse_symbols, SYMBOL_PATTERN
+from ..templating import templates
+from fastapi.responses import HTMLResponse, StreamingResponse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-from jose import JWTError, jwt
+import numpy as np
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
-async def get_current_user_from_cookie(
-    request: Request,
-    access_token: Optional[str] = Cookie(None),
-    db: Session = Depends(get_db)
-):
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    try:
-        # Remove "Bearer " prefix if present
-        token = access_token.replace("Bearer ", "")
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication token")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid authentication token")
-    
-    user = db.query(models.User).filter(models.User.username == username).first()
+async def get_current_user_from_cookie(request: Request):
+    # Identity is resolved once per request by middleware.AuthMiddleware
+    user = getattr(request.state, "user", None)
     if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    # Get user's role
-    user.role = db.query(models.Role).filter(models.Role.id == user.role_id).first()
-    
+        raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(
     request: Request,
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     return templates.TemplateResponse(
         "dashboard.html",
@@ -52,3 +35,156 @@ async def dashboard(
             "is_superadmin": current_user.is_superadmin()
         }
     )
+
+async def _broker_call(call):
+    try:
+        return await call()
+    except alpaca.AlpacaError as exc:
+        raise HTTPException(status_code=502, detail=f"Broker request failed: {exc.message}")
+
+# Dashboard widgets poll these; concurrent viewers share one upstream call
+@router.get("/dashboard/account")
+async def account(current_user: auth.Principal = Depends(get_current_user_from_cookie)):
+    return await _broker_call(alpaca.get_client().get_account)
+
+@router.get("/dashboard/positions")
+async def positions(current_user: auth.Principal = Depends(get_current_user_from_cookie)):
+    return await _broker_call(alpaca.get_client().get_positions)
+
+# Live market data
+# Browsers stream ticks for a comma separated symbol list from
+# /dashboard/stream, over a WebSocket or as server-sent events. Each message
+# carries the latest tick per symbol and the client's current lag.
+SSE_KEEPALIVE_SECONDS = 15
+
+def _stream_message(subscriber, batch) -> dict:
+    return {"ticks": batch, "lag_ms": round(subscriber.lag * 1000, 2), "conflated": subscriber.conflated}
+
+@router.websocket("/dashboard/stream")
+async def stream_websocket(websocket: WebSocket, symbols: str):
+    # Unauthenticated sockets are closed by the auth middleware
+    try:
+        symbol_set = parse_symbols(symbols)
+    except ValueError:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscriber = hub.subscribe(symbol_set)
+
+    async def wait_for_close():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    closed = asyncio.create_task(wait_for_close())
+    try:
+        while not closed.done():
+            next_batch = asyncio.create_task(subscriber.next_batch())
+            done, _ = await asyncio.wait({next_batch, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if next_batch not in done:
+                next_batch.cancel()
+                break
+            await websocket.send_json(_stream_message(subscriber, next_batch.result()))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        hub.unsubscribe(subscriber)
+
+@router.get("/dashboard/stream")
+async def stream_events(
+    request: Request,
+    symbols: str,
+    current_user: auth.Principal = Depends(get_current_user_from_cookie)
+):
+    try:
+        symbol_set = parse_symbols(symbols)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    subscriber = hub.subscribe(symbol_set)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    batch = await asyncio.wait_for(subscriber.next_batch(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(_stream_message(subscriber, batch))}\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/dashboard/stream/stats")
+async def stream_stats(current_user: auth.Principal = Depends(get_current_user_from_cookie)):
+    auth.check_admin_access(current_user)
+    return hub.stats()
+
+# Chart history from the in-memory bar store, as one array per column
+@router.get("/dashboard/bars/{symbol}")
+async def symbol_bars(
+    symbol: str,
+    timeframe: str = "1m",
+    limit: int = Query(500, ge=1),
+    current_user: auth.Principal = Depends(get_current_user_from_cookie)
+):
+    symbol = symbol.upper()
+    if not SYMBOL_PATTERN.fullmatch(symbol):
+        raise HTTPException(status_code=400, detail=f"Invalid symbol: {symbol}")
+    if timeframe != "tick" and timeframe not in bars.TIMEFRAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown timeframe, expected one of: tick, {', '.join(bars.TIMEFRAMES)}"
+        )
+
+    dtype = bars.TICK_DTYPE if timeframe == "tick" else bars.BAR_DTYPE
+    history = bars.store.get(symbol)
+    if history is None:
+        rows = np.empty(0, dtype=dtype)
+    elif timeframe == "tick":
+        rows = history.ticks.window(limit)
+    else:
+        rows = history.series[timeframe].bars.window(limit)
+    return {"symbol": symbol, "timeframe": timeframe, **{name: rows[name].tolist() for name in dtype.names}}
+
+def _as_utc(value: datetime) -> datetime:
+    # Naive datetimes are taken as UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+# Longer chart ranges and backtests read from the local history cache, which
+# only downloads the parts of a range it has not seen before
+@router.get("/dashboard/history/{symbol}")
+async def symbol_history(
+    symbol: str,
+    timeframe: str = "1m",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: auth.Principal = Depends(get_current_user_from_cookie)
+):
+    symbol = symbol.upper()
+    if not SYMBOL_PATTERN.fullmatch(symbol):
+        raise HTTPException(status_code=400, detail=f"Invalid symbol: {symbol}")
+    if timeframe not in history.TIMEFRAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown timeframe, expected one of: {', '.join(history.TIMEFRAMES)}"
+        )
+    end = _as_utc(end) if end else datetime.now(timezone.utc)
+    start = _as_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > timedelta(days=history.HISTORY_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Ranges are limited to {history.HISTORY_MAX_DAYS} days")
+
+    columns = await _broker_call(
+        lambda: history.cache.get_bars(symbol, timeframe, int(start.timestamp()), int(end.timestamp()))
+    )
+    return {"symbol": symbol, "timeframe": timeframe, **{name: values.tolist() for name, values in columns.items()}}
@@ -1,20 +1,126 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Form, Query
+from sqlalchemy import select, tuple_, insert, delete, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from .. import models, schemas, auth
-from ..database import get_db
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from typing import List
+from ..database import get_db, session_scope
+from ..templating import templates
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from typing import List, Literal, Optional
+from datetime import datetime
+import base64
+import codecs
+import csv
+import io
+import json
+import os
 from .dashboard_router import get_current_user_from_cookie
+from .auth_router import get_auth_settings, invalidate_auth_settings
 
 router = APIRouter(prefix="/manage")
-templates = Jinja2Templates(directory="app/templates")
+
+MAX_PAGE_SIZE = 500
+
+# Bulk import/export
+BULK_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "500"))
+MAX_REPORTED_ERRORS = 1000
+EXPORT_FIELDS = ["id", "username", "email", "role", "is_active", "created_at"]
+
+SORT_COLUMNS = {
+    "id": models.User.id,
+    "username": models.User.username,
+}
+
+def user_list_params(
+    role: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    username_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    sort: Literal["id", "username"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.UserListParams:
+    return schemas.UserListParams(
+        role=role,
+        is_active=is_active,
+        username_prefix=username_prefix,
+        created_after=created_after,
+        created_before=created_before,
+        sort=sort,
+        order=order,
+        cursor=cursor,
+        limit=limit
+    )
+
+def _encode_cursor(user: models.User, sort: str) -> str:
+    raw = json.dumps([getattr(user, sort), user.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        return value, int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _list_users(db: AsyncSession, params: schemas.UserListParams):
+    """
+    Return one page of users and the cursor for the next page (or None).
+
+    Pages are keyset-based on (sort column, id), so every page costs an
+    index range scan regardless of how deep into the listing it is.
+    """
+    sort_column = SORT_COLUMNS[params.sort]
+    stmt = select(models.User)
+
+    # Filters
+    if params.role:
+        role_id = select(models.Role.id).where(models.Role.name == params.role).scalar_subquery()
+        stmt = stmt.where(models.User.role_id == role_id)
+    if params.is_active is not None:
+        stmt = stmt.where(models.User.is_active == params.is_active)
+    if params.username_prefix:
+        # Range predicate instead of LIKE so the username index is used
+        stmt = stmt.where(
+            models.User.username >= params.username_prefix,
+            models.User.username < params.username_prefix + "\uffff"
+        )
+    if params.created_after:
+        stmt = stmt.where(models.User.created_at >= params.created_after)
+    if params.created_before:
+        stmt = stmt.where(models.User.created_at < params.created_before)
+
+    # Keyset position
+    if params.cursor:
+        value, last_id = _decode_cursor(params.cursor)
+        position = tuple_(sort_column, models.User.id)
+        if params.order == "asc":
+            stmt = stmt.where(position > tuple_(value, last_id))
+        else:
+            stmt = stmt.where(position < tuple_(value, last_id))
+
+    if params.order == "asc":
+        stmt = stmt.order_by(sort_column.asc(), models.User.id.asc())
+    else:
+        stmt = stmt.order_by(sort_column.desc(), models.User.id.desc())
+
+    users = (await db.scalars(stmt.limit(params.limit + 1))).all()
+    next_cursor = None
+    if len(users) > params.limit:
+        users = users[:params.limit]
+        next_cursor = _encode_cursor(users[-1], params.sort)
+    return users, next_cursor
 
 @router.get("/auth", response_class=HTMLResponse)
 async def manage_auth_page(
     request: Request,
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if user is superadmin
     if not current_user.is_superadmin():
@@ -24,17 +130,7 @@ async def manage_auth_page(
         )
     
     # Get auth settings
-    settings = db.query(models.AuthSettings).first()
-    if not settings:
-        # Create default settings if none exist
-        settings = models.AuthSettings(
-            regular_auth_enabled=True,
-            google_auth_enabled=False,
-            updated_by=current_user.id
-        )
-        db.add(settings)
-        db.commit()
-        db.refresh(settings)
+    settings = await get_auth_settings(db)
     
     return templates.TemplateResponse(
         "manage_auth.html",
@@ -54,8 +150,8 @@ async def update_auth_settings(
     google_auth_enabled: bool = Form(False),
     google_client_id: str = Form(None),
     google_client_secret: str = Form(None),
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if user is superadmin
     if not current_user.is_superadmin():
@@ -70,7 +166,7 @@ async def update_auth_settings(
             "manage_auth.html",
             {
                 "request": request,
-                "settings": db.query(models.AuthSettings).first(),
+                "settings": await get_auth_settings(db),
                 "user": current_user,
                 "is_admin": current_user.is_admin(),
                 "is_superadmin": current_user.is_superadmin(),
@@ -84,7 +180,7 @@ async def update_auth_settings(
             "manage_auth.html",
             {
                 "request": request,
-                "settings": db.query(models.AuthSettings).first(),
+                "settings": await get_auth_settings(db),
                 "user": current_user,
                 "is_admin": current_user.is_admin(),
                 "is_superadmin": current_user.is_superadmin(),
@@ -93,7 +189,7 @@ async def update_auth_settings(
         )
     
     # Update settings
-    settings = db.query(models.AuthSettings).first()
+    settings = await db.scalar(select(models.AuthSettings))
     if not settings:
         settings = models.AuthSettings()
         db.add(settings)
@@ -104,8 +200,9 @@ async def update_auth_settings(
     settings.google_client_secret = google_client_secret if google_auth_enabled else None
     settings.updated_by = current_user.id
     
-    db.commit()
-    db.refresh(settings)
+    await db.commit()
+    await db.refresh(settings)
+    invalidate_auth_settings()
     
     return templates.TemplateResponse(
         "manage_auth.html",
@@ -122,8 +219,9 @@ async def update_auth_settings(
 @router.get("", response_class=HTMLResponse)
 async def manage_users_page(
     request: Request,
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    params: schemas.UserListParams = Depends(user_list_params),
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if user has admin access
     if not current_user.is_admin():
@@ -132,14 +230,20 @@ async def manage_users_page(
             detail="You don't have permission to access this resource"
         )
     
-    # Get all users and roles
-    users = db.query(models.User).all()
-    roles = db.query(models.Role).all()
+    # Get the current page of users; role names come from the role cache
+    # so rendering the rows never touches the lazy User.role relationship
+    users, next_cursor = await _list_users(db, params)
+    role_names = await auth.get_role_names(db, {user.role_id for user in users})
+    roles = await auth.get_roles(db)
 
     # Filter roles based on user permissions
     if not current_user.is_superadmin():
         # Regular admins can only see and assign user role
         roles = [role for role in roles if role.name == "user"]
+
+    next_url = None
+    if next_cursor:
+        next_url = str(request.url.include_query_params(cursor=next_cursor))
     
     return templates.TemplateResponse(
         "manage_users.html",
@@ -147,6 +251,10 @@ async def manage_users_page(
             "request": request,
             "users": users,
             "roles": roles,
+            "role_names": role_names,
+            "filters": params,
+            "next_url": next_url,
+            "first_url": str(request.url.remove_query_params("cursor")) if params.cursor else None,
             "user": current_user,
             "current_user": current_user,
             "is_admin": current_user.is_admin(),
@@ -156,22 +264,30 @@ async def manage_users_page(
 
 @router.get("/users", response_model=List[schemas.User])
 async def get_users(
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    params: schemas.UserListParams = Depends(user_list_params),
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     if not current_user.is_admin():
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have permission to access this resource"
         )
-    users = db.query(models.User).all()
+    users, next_cursor = await _list_users(db, params)
+    # The body stays a plain list; the next page is advertised in headers
+    if next_cursor:
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
     return users
 
 @router.post("/users")
 async def create_user(
     user: schemas.UserCreate,
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     if not current_user.is_admin():
         return JSONResponse(
@@ -181,10 +297,10 @@ async def create_user(
     
     try:
         # Check if user exists
-        db_user = db.query(models.User).filter(
+        db_user = await db.scalar(select(models.User).where(
             (models.User.email == user.email) | 
             (models.User.username == user.username)
-        ).first()
+        ))
         if db_user:
             return JSONResponse(
                 status_code=400,
@@ -198,8 +314,9 @@ async def create_user(
                 content={"message": "You can only create users with user role"}
             )
         
-        # Create new user
-        hashed_password = auth.get_password_hash(user.password)
+        # Create new user (release the pooled connection while bcrypt runs)
+        await db.commit()
+        hashed_password = await auth.get_password_hash_async(user.password)
         db_user = models.User(
             email=user.email,
             username=user.username,
@@ -207,12 +324,14 @@ async def create_user(
             role_id=user.role_id
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return JSONResponse(
             status_code=200,
             content={"message": "User created successfully"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -223,8 +342,8 @@ async def create_user(
 async def update_user(
     user_id: int,
     user_update: schemas.UserUpdate,
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     if not current_user.is_admin():
         return JSONResponse(
@@ -234,7 +353,11 @@ async def update_user(
     
     try:
         # Get user to update
-        db_user = db.query(models.User).filter(models.User.id == user_id).first()
+        db_user = await db.scalar(
+            select(models.User)
+            .options(selectinload(models.User.role))
+            .where(models.User.id == user_id)
+        )
         if not db_user:
             return JSONResponse(
                 status_code=404,
@@ -271,18 +394,25 @@ async def update_user(
         
         # Update password if provided
         if "password" in update_data and update_data["password"]:
-            update_data["hashed_password"] = auth.get_password_hash(update_data.pop("password"))
+            await db.commit()  # Release the pooled connection while bcrypt runs
+            update_data["hashed_password"] = await auth.get_password_hash_async(update_data.pop("password"))
         
         # Update user fields
+        previous_username = db_user.username
         for field, value in update_data.items():
             setattr(db_user, field, value)
         
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        auth.invalidate_principal(previous_username)
+        if db_user.username != previous_username:
+            auth.invalidate_principal(db_user.username)
         return JSONResponse(
             status_code=200,
             content={"message": "User updated successfully"}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -292,8 +422,8 @@ async def update_user(
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    current_user: models.User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
 ):
     if not current_user.is_admin():
         return JSONResponse(
@@ -303,7 +433,11 @@ async def delete_user(
     
     try:
         # Get user to delete
-        db_user = db.query(models.User).filter(models.User.id == user_id).first()
+        db_user = await db.scalar(
+            select(models.User)
+            .options(selectinload(models.User.role))
+            .where(models.User.id == user_id)
+        )
         if not db_user:
             return JSONResponse(
                 status_code=404,
@@ -331,8 +465,14 @@ async def delete_user(
                 content={"message": "You cannot delete your own account"}
             )
         
-        db.delete(db_user)
-        db.commit()
+        # SQLite does not enforce ON DELETE CASCADE, so remove the user's
+        # backtests explicitly
+        run_ids = select(models.BacktestRun.id).where(models.BacktestRun.user_id == db_user.id)
+        await db.execute(delete(models.BacktestResult).where(models.BacktestResult.run_id.in_(run_ids)))
+        await db.execute(delete(models.BacktestRun).where(models.BacktestRun.user_id == db_user.id))
+        await db.delete(db_user)
+        await db.commit()
+        auth.invalidate_principal(db_user.username)
         return JSONResponse(
             status_code=200,
             content={"message": "User deleted successfully"}
@@ -342,3 +482,269 @@ async def delete_user(
             status_code=500,
             content={"message": str(e)}
         )
+
+
+async def _iter_lines(request: Request):
+    # Decode the request body incrementally instead of buffering it
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def _iter_import_records(request: Request, is_csv: bool):
+    """
+    Yield (line number, record, error) for each non-blank line of an upload.
+    CSV uploads need a header row and one record per line.
+    """
+    header = None
+    line_no = 0
+    async for line in _iter_lines(request):
+        line_no += 1
+        if not line.strip():
+            continue
+        if is_csv:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            yield line_no, dict(zip(header, values)), None
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, None, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "Expected a JSON object"
+                continue
+            yield line_no, record, None
+
+async def _import_batch(db: AsyncSession, rows, role_ids: dict, seen: set):
+    """
+    Validate, de-duplicate, hash and insert one batch of import rows.
+    Returns the number of created users and a list of row errors.
+    """
+    errors = []
+    candidates = []
+    for line_no, record, error in rows:
+        if error:
+            errors.append({"line": line_no, "error": error})
+            continue
+        try:
+            item = schemas.UserImport.model_validate(record)
+        except ValidationError as e:
+            first = e.errors()[0]
+            field = ".".join(str(part) for part in first["loc"])
+            errors.append({"line": line_no, "error": f"{field}: {first['msg']}"})
+            continue
+        role_id = role_ids.get(item.role or "user")
+        if role_id is None:
+            errors.append({"line": line_no, "error": f"Role not allowed: {item.role}"})
+            continue
+        if ("username", item.username) in seen or ("email", item.email) in seen:
+            errors.append({"line": line_no, "error": "Duplicate username or email in upload"})
+            continue
+        seen.add(("username", item.username))
+        seen.add(("email", item.email))
+        candidates.append((line_no, item, role_id))
+
+    if not candidates:
+        return 0, errors
+
+    # One set-based query finds every row that clashes with existing users
+    result = await db.execute(
+        select(models.User.username, models.User.email).where(or_(
+            models.User.username.in_([item.username for _, item, _ in candidates]),
+            models.User.email.in_([item.email for _, item, _ in candidates])
+        ))
+    )
+    taken = set()
+    for username, email in result.all():
+        taken.add(("username", username))
+        taken.add(("email", email))
+    new_users = []
+    for line_no, item, role_id in candidates:
+        if ("username", item.username) in taken or ("email", item.email) in taken:
+            errors.append({"line": line_no, "error": "Email or username already registered"})
+        else:
+            new_users.append((line_no, item, role_id))
+
+    if not new_users:
+        return 0, errors
+
+    # Release the pooled connection while the batch is hashed in parallel
+    await db.commit()
+    try:
+        hashes = await auth.get_password_hashes_async([item.password for _, item, _ in new_users])
+    except HTTPException as e:
+        if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+            raise
+        # The hash pool is saturated by logins; earlier batches are already
+        # committed, so report this one and carry on with the next
+        for line_no, item, _ in new_users:
+            _release(seen, item)
+            errors.append({"line": line_no, "error": "Not imported: server busy, please retry this row"})
+        return 0, errors
+
+    values = [
+        {
+            "email": item.email,
+            "username": item.username,
+            "hashed_password": hashed_password,
+            "role_id": role_id,
+        }
+        for (_, item, role_id), hashed_password in zip(new_users, hashes)
+    ]
+    try:
+        await db.execute(insert(models.User), values)
+        await db.commit()
+        return len(new_users), errors
+    except IntegrityError:
+        # Another request inserted a clashing user after the existence
+        # check; insert row by row so only the conflicting rows are lost
+        await db.rollback()
+
+    created = 0
+    for (line_no, item, _), row in zip(new_users, values):
+        try:
+            await db.execute(insert(models.User), [row])
+            await db.commit()
+            created += 1
+        except IntegrityError:
+            await db.rollback()
+            _release(seen, item)
+            errors.append({"line": line_no, "error": "Email or username already registered"})
+    return created, errors
+
+def _release(seen: set, item: schemas.UserImport):
+    # Let a later row of the upload claim a name that was not imported
+    seen.discard(("username", item.username))
+    seen.discard(("email", item.email))
+
+@router.post("/users/bulk")
+async def bulk_import_users(
+    request: Request,
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create users from a CSV (text/csv, with a header row) or NDJSON
+    (application/x-ndjson) body with username, email, password and an
+    optional role name per record. The body is processed in batches.
+    """
+    if not current_user.is_admin():
+        return JSONResponse(
+            status_code=403,
+            content={"message": "You don't have permission to create users"}
+        )
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in ("text/csv", "application/csv"):
+        is_csv = True
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        is_csv = False
+    else:
+        return JSONResponse(
+            status_code=415,
+            content={"message": "Upload must be text/csv or application/x-ndjson"}
+        )
+
+    # Regular admins can only create users with user role
+    role_names = await auth.get_role_names(db)
+    role_ids = {
+        name: role_id for role_id, name in role_names.items()
+        if current_user.is_superadmin() or name == "user"
+    }
+
+    created = 0
+    errors = []
+    error_count = 0
+    seen = set()
+    batch = []
+
+    async def flush():
+        nonlocal created, error_count
+        batch_created, batch_errors = await _import_batch(db, batch, role_ids, seen)
+        created += batch_created
+        error_count += len(batch_errors)
+        errors.extend(batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        batch.clear()
+
+    async for row in _iter_import_records(request, is_csv):
+        batch.append(row)
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    return JSONResponse(
+        status_code=200,
+        content={"created": created, "error_count": error_count, "errors": errors}
+    )
+
+@router.get("/users/export")
+async def export_users(
+    format: Literal["csv", "ndjson"] = "csv",
+    current_user: auth.Principal = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    if not current_user.is_admin():
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this resource"
+        )
+    role_names = await auth.get_role_names(db)
+
+    def serialize(user: models.User):
+        return {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "role": role_names.get(user.role_id),
+            "is_active": user.is_active,
+            "created_at": user.created_at.isoformat() if user.created_at else None,
+        }
+
+    async def rows():
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            yield buffer.getvalue()
+
+        # Walk the table in id order one batch at a time, on a session owned
+        # by the stream so it outlives the request dependencies
+        last_id = 0
+        async with session_scope() as export_db:
+            while True:
+                users = (await export_db.scalars(
+                    select(models.User)
+                    .where(models.User.id > last_id)
+                    .order_by(models.User.id)
+                    .limit(BULK_BATCH_SIZE)
+                )).all()
+                if not users:
+                    break
+                last_id = users[-1].id
+                if format == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+                    writer.writerows(serialize(user) for user in users)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(json.dumps(serialize(user)) + "\n" for user in users)
+                # Keep the identity map from growing with the export
+                export_db.expunge_all()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'}
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Dict, List, Optional, Literal, Union
 from datetime import datetime
 
 class RoleBase(BaseModel):
@@ -21,6 +21,9 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class UserImport(UserCreate):
+    role: Optional[str] = None  # Role name; defaults to "user"
+
 class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
     username: Optional[str] = None
@@ -38,6 +41,17 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserListParams(BaseModel):
+    role: Optional[str] = None
+    is_active: Optional[bool] = None
+    username_prefix: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    sort: Literal["id", "username"] = "id"
+    order: Literal["asc", "desc"] = "asc"
+    cursor: Optional[str] = None
+    limit: int = 50
+
 class UserInDB(User):
     hashed_password: str
 
@@ -70,7 +84,51 @@ class AuthSettingsUpdate(BaseModel):
 class AuthSettings(AuthSettingsBase):
     id: int
     updated_at: Optional[datetime] = None
-    updated_by: int
+    updated_by: Optional[int] = None
 
     class Config:
         from_attributes = True
+        frozen = True  # Instances are shared through the settings cache
+
+class BacktestCreate(BaseModel):
+    strategy: str
+    symbol: str
+    timeframe: str = "1d"
+    start: datetime
+    end: datetime
+    parameters: Dict[str, List[Union[int, float]]] = {}  # Values to sweep per parameter
+    fee_bps: float = 1.0
+
+class BacktestResult(BaseModel):
+    parameters: Dict[str, Union[int, float]]
+    total_return: Optional[float] = None  # None when the metric overflowed
+    sharpe: Optional[float] = None
+    max_drawdown: Optional[float] = None
+    trades: int
+    exposure: float
+
+    class Config:
+        from_attributes = True
+
+class BacktestRun(BaseModel):
+    id: int
+    strategy: str
+    symbol: str
+    timeframe: str
+    start: datetime
+    end: datetime
+    parameters: Dict[str, List[Union[int, float]]]
+    fee_bps: float
+    status: str
+    error: Optional[str] = None
+    bars: Optional[int] = None
+    combinations: Optional[int] = None
+    duration_seconds: Optional[float] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class BacktestRunDetail(BacktestRun):
+    results: List[BacktestResult] = []
@@ -0,0 +1,84 @@
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from pathlib import Path
+import hashlib
+import os
+from dotenv import load_dotenv
+from .assets import static_url
+from .cache import TTLCache
+from .metrics import TimedTemplate
+from .database import DATA_DIR
+
+# Load environment variables
+load_dotenv()
+
+DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+TEMPLATE_DIR = "app/templates"
+TEMPLATE_CACHE_DIR = Path(os.getenv("TEMPLATE_CACHE_DIR", DATA_DIR / ".template_cache"))
+TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# One environment shared by every router, so each template is compiled once
+# per worker. Compiled bytecode is also written to disk, which lets fresh
+# workers skip parsing; entries are keyed on the template source checksum.
+# Template files are only re-checked for changes in DEBUG mode.
+templates = Jinja2Templates(
+    directory=TEMPLATE_DIR,
+    auto_reload=DEBUG,
+    bytecode_cache=FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR)),
+    cache_size=-1  # Never evict compiled templates
+)
+
+# Record render time for every template loaded from here on
+templates.env.template_class = TimedTemplate
+
+# Fingerprinted asset URLs: {{ static_url('css/app.css') }}
+templates.env.globals["static_url"] = static_url
+
+def precompile_templates():
+    """
+    Load every template into the environment cache at startup so the first
+    request after a deploy does not pay for parsing and compilation.
+    """
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return names
+
+# Rendered page cache
+# Pages whose output depends only on a few inputs (anonymous landing, login
+# and register pages) are rendered once per key and served with an ETag, so
+# probes and bots revalidating with If-None-Match get an empty 304.
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "256"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))
+
+page_cache = TTLCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def cached_template_response(request: Request, name: str, context: dict, key: tuple = ()) -> Response:
+    """
+    Render ``name`` once per (template, *key) and answer conditional requests.
+
+    ``key`` must cover everything the rendered output depends on besides
+    the template itself, e.g. the auth settings snapshot and the role.
+    """
+    cache_key = (name, *key)
+    page = page_cache.get(cache_key)
+    if page is None:
+        body = templates.get_template(name).render({"request": request, **context}).encode()
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        page = (body, etag)
+        page_cache.set(cache_key, page)
+
+    body, etag = page
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Cookie"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(body, headers=headers)
@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The app reads its configuration at import time, so point it at a throwaway
+# database before anything imports it
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='openalgo-tests-')}/test.db"
+sys.path.insert(0, str(ROOT))
+# Static files and templates are mounted relative to the repository root
+os.chdir(ROOT)
+
+ADMIN = {"email": "admin@example.com", "username": "admin", "password": "admin-password"}
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture(scope="session")
+def admin_token(client) -> str:
+    """Access cookie of the superadmin (the first registered user)."""
+    response = client.post("/register", json=ADMIN)
+    assert response.status_code == 200, response.text
+    response = client.post(
+        "/login", data={"username": ADMIN["username"], "password": ADMIN["password"]}, follow_redirects=False
+    )
+    assert response.status_code == 302, response.text
+    return response.cookies["access_token"]
+
+@pytest.fixture
+def admin_client(client, admin_token):
+    client.cookies.set("access_token", admin_token)
+    yield client
+    client.cookies.clear()
@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import alpaca
+
+class Upstream:
+    """Replays queued responses through httpx.MockTransport and records requests."""
+
+    def __init__(self, *responses: httpx.Response, delay: float = 0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays requested from asyncio.sleep by the retry loop, without sleeping."""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(alpaca.asyncio, "sleep", fake_sleep)
+    return delays
+
+def call(upstream: Upstream, make_calls):
+    async def run():
+        client = alpaca.AlpacaClient(http2=False, transport=httpx.MockTransport(upstream.handler))
+        try:
+            return await make_calls(client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
+def test_429_is_retried_after_retry_after(sleeps):
+    upstream = Upstream(
+        httpx.Response(429, headers={"Retry-After": "2"}, json={"message": "too many requests"}),
+        httpx.Response(200, json={"status": "ACTIVE"}),
+    )
+    assert call(upstream, lambda client: client.get_account()) == {"status": "ACTIVE"}
+    assert len(upstream.requests) == 2
+    assert sleeps == [2.0]
+
+def test_malformed_retry_after_falls_back_to_backoff(sleeps, monkeypatch):
+    monkeypatch.setattr(alpaca.random, "uniform", lambda low, high: high)
+    upstream = Upstream(
+        httpx.Response(429, headers={"Retry-After": "soon"}),
+        httpx.Response(503, headers={"Retry-After": "Mon, 99 Foo 2024"}),
+        httpx.Response(200, json=[]),
+    )
+    assert call(upstream, lambda client: client.get_positions()) == []
+    assert sleeps == [alpaca.ALPACA_RETRY_BACKOFF, alpaca.ALPACA_RETRY_BACKOFF * 2]
+
+def test_retries_stop_at_max_retries(sleeps):
+    upstream = Upstream(httpx.Response(429, json={"message": "slow down"}))
+    with pytest.raises(alpaca.AlpacaError) as excinfo:
+        call(upstream, lambda client: client.get_clock())
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.message == "slow down"
+    assert len(upstream.requests) == alpaca.ALPACA_MAX_RETRIES + 1
+
+def test_identical_concurrent_gets_make_one_upstream_call():
+    upstream = Upstream(httpx.Response(200, json={"is_open": True}), delay=0.05)
+
+    async def many(client):
+        results = await asyncio.gather(*(client.get_clock() for _ in range(10)))
+        return results, client.stats
+
+    results, stats = call(upstream, many)
+    assert results == [{"is_open": True}] * 10
+    assert len(upstream.requests) == 1
+    assert stats["coalesced"] == 9
+
+def test_get_bars_follows_next_page_token():
+    upstream = Upstream(
+        httpx.Response(200, json={"bars": [{"t": "2024-01-02T14:30:00Z"}], "next_page_token": "page-2"}),
+        httpx.Response(200, json={"bars": [{"t": "2024-01-02T14:31:00Z"}], "next_page_token": "page-3"}),
+        httpx.Response(200, json={"bars": None, "next_page_token": None}),
+    )
+    bars = call(upstream, lambda client: client.get_bars("AAPL", "1Min", "2024-01-02T14:30:00Z", "2024-01-02T14:31:00Z"))
+    assert [bar["t"] for bar in bars] == ["2024-01-02T14:30:00Z", "2024-01-02T14:31:00Z"]
+
+    assert len(upstream.requests) == 3
+    assert all(request.url.path == "/v2/stocks/AAPL/bars" for request in upstream.requests)
+    assert [request.url.params.get("page_token") for request in upstream.requests] == [None, "page-2", "page-3"]
+    assert all(request.url.params["start"] == "2024-01-02T14:30:00Z" for request in upstream.requests)
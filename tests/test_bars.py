@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from app.bars import BAR_DTYPE, TICK_DTYPE, TIMEFRAMES, BarStore, RingBuffer
+
+def random_trades(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    times = 1_700_000_000 + np.cumsum(rng.exponential(0.1, count))
+    prices = 100 + np.cumsum(rng.normal(0, 0.05, count))
+    sizes = rng.integers(1, 500, count).astype("f8")
+    return times, prices, sizes
+
+def rebuild_bars(times, prices, sizes, seconds: int) -> np.ndarray:
+    """OHLCV bars computed in one pass over the raw trades."""
+    starts = (times // seconds).astype("i8") * seconds
+    boundaries = np.flatnonzero(np.diff(starts)) + 1
+    first = np.concatenate(([0], boundaries))
+    last = np.concatenate((boundaries, [len(times)])) - 1
+    bars = np.zeros(len(first), dtype=BAR_DTYPE)
+    bars["time"] = starts[first]
+    bars["open"] = prices[first]
+    bars["high"] = np.maximum.reduceat(prices, first)
+    bars["low"] = np.minimum.reduceat(prices, first)
+    bars["close"] = prices[last]
+    bars["volume"] = np.add.reduceat(sizes, first)
+    return bars
+
+def test_bars_match_a_rebuild_from_raw_trades():
+    # About 33 minutes of trades, so every timeframe fits its default capacity
+    times, prices, sizes = random_trades(20_000)
+    store = BarStore()
+    for timestamp, price, size in zip(times, prices, sizes):
+        store.add_trade("TEST", float(timestamp), float(price), float(size))
+    history = store.get("TEST")
+
+    for name, (seconds, capacity) in TIMEFRAMES.items():
+        expected = rebuild_bars(times, prices, sizes, seconds)
+        assert len(expected) <= capacity
+        actual = history.series[name].bars.window()
+        assert np.array_equal(actual["time"], expected["time"]), name
+        for column in ("open", "high", "low", "close", "volume"):
+            assert np.allclose(actual[column], expected[column]), (name, column)
+
+    ticks = history.ticks.window()
+    assert np.array_equal(ticks["price"], prices[-len(ticks):])
+
+def test_late_trade_does_not_reopen_a_published_bar():
+    store = BarStore()
+    store.add_trade("TEST", 120.0, 10.0, 1.0)
+    store.add_trade("TEST", 59.0, 99.0, 1.0)
+    bars = store.get("TEST").series["1m"].bars.window()
+    assert bars["time"].tolist() == [120]
+    assert bars["high"].tolist() == [10.0]
+
+def test_ring_buffer_window_is_latest_records_without_copy():
+    ring = RingBuffer(TICK_DTYPE, 5)
+    for i in range(12):
+        ring.append((float(i), float(i), 1.0))
+    assert len(ring) == 5
+    assert ring.window()["time"].tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert ring.window(2)["time"].tolist() == [10.0, 11.0]
+    assert ring.window(0).size == 0
+
+    window = ring.window(3)
+    assert window.base is ring.window().base
+    with pytest.raises(ValueError):
+        window["price"][0] = 1.0
+
+def test_store_drops_the_least_recently_traded_symbol():
+    store = BarStore(max_symbols=2)
+    store.add_trade("A", 1.0, 1.0, 1.0)
+    store.add_trade("B", 1.0, 1.0, 1.0)
+    store.add_trade("A", 2.0, 1.0, 1.0)
+    store.add_trade("C", 2.0, 1.0, 1.0)
+    assert store.get("B") is None
+    assert store.get("A") is not None and store.get("C") is not None
@@ -0,0 +1,81 @@
+import gzip
+import json
+
+import brotli
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.assets import IMMUTABLE_CACHE_CONTROL, PrecompressedStaticFiles, build_assets
+from app.compression import CompressionMiddleware
+
+ROWS = [{"id": i, "username": f"member{i}", "email": f"member{i}@example.com"} for i in range(200)]
+
+@pytest.fixture(scope="module")
+def compressed_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/rows")
+    async def rows():
+        return JSONResponse(ROWS)
+
+    @app.get("/export")
+    async def export():
+        async def lines():
+            for start in range(0, len(ROWS), 50):
+                yield "".join(json.dumps(row) + "\n" for row in ROWS[start:start + 50])
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    with TestClient(app) as client:
+        yield client
+
+def get_raw(client, path: str, accept_encoding: str):
+    with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+@pytest.mark.parametrize("accept_encoding, encoding", [
+    ("gzip, deflate, br", "br"),
+    ("gzip, br;q=0", "gzip"),
+])
+def test_middleware_negotiates_the_encoding(compressed_client, accept_encoding, encoding):
+    response, body = get_raw(compressed_client, "/rows", accept_encoding)
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(body)
+    decompress = brotli.decompress if encoding == "br" else gzip.decompress
+    assert json.loads(decompress(body)) == ROWS
+
+def test_streamed_brotli_response_decodes_to_every_row(compressed_client):
+    response, body = get_raw(compressed_client, "/export", "br")
+    assert response.headers["content-encoding"] == "br"
+    assert "content-length" not in response.headers
+    lines = brotli.decompress(body).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+
+def test_identity_is_sent_uncompressed(compressed_client):
+    response, body = get_raw(compressed_client, "/rows", "identity")
+    assert "content-encoding" not in response.headers
+    assert json.loads(body) == ROWS
+
+def test_precompressed_assets_serve_the_brotli_variant(tmp_path):
+    source = "body { color: #333; }\n" * 100
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "app.css").write_text(source)
+    manifest = build_assets(tmp_path)
+    fingerprinted = manifest["css/app.css"]
+    assert (tmp_path / (fingerprinted + ".br")).exists()
+    assert (tmp_path / (fingerprinted + ".gz")).exists()
+
+    app = FastAPI()
+    app.mount("/static", PrecompressedStaticFiles(directory=tmp_path), name="static")
+    with TestClient(app) as client:
+        response, body = get_raw(client, f"/static/{fingerprinted}", "gzip, br")
+        assert response.headers["content-encoding"] == "br"
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert brotli.decompress(body).decode() == source
+
+        response, body = get_raw(client, f"/static/{fingerprinted}", "gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(body).decode() == source
@@ -0,0 +1,117 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt as google_jwt
+
+from app import google_oauth
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+def make_key():
+    """An RSA private key (PEM) and a self-signed certificate for it, as Google serves them."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "test")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return private_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+class FakeGoogle:
+    """Token, userinfo and certs endpoints served through httpx.MockTransport."""
+
+    def __init__(self):
+        self.keys = {}
+        self.signing_kid = None
+        self.cert_fetches = 0
+
+    def add_key(self, kid: str):
+        self.keys[kid] = make_key()
+        self.signing_kid = kid
+
+    def id_token(self, email: str) -> str:
+        private_pem, _ = self.keys[self.signing_kid]
+        now = int(time.time())
+        return google_jwt.encode(
+            crypt.RSASigner.from_string(private_pem, key_id=self.signing_kid),
+            {"iss": "https://accounts.google.com", "aud": CLIENT_ID, "sub": email,
+             "email": email, "iat": now, "exp": now + 300}
+        ).decode()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url.copy_with(query=None))
+        if url == google_oauth.CERTS_ENDPOINT:
+            self.cert_fetches += 1
+            return httpx.Response(
+                200,
+                json={kid: cert for kid, (_, cert) in self.keys.items()},
+                headers={"Cache-Control": "public, max-age=3600"}
+            )
+        if url == google_oauth.TOKEN_ENDPOINT:
+            email = request.content.decode().split("code=")[1].split("&")[0] + "@example.com"
+            return httpx.Response(200, json={"access_token": email, "id_token": self.id_token(email)})
+        if url == google_oauth.USERINFO_ENDPOINT:
+            email = request.headers["authorization"].removeprefix("Bearer ")
+            return httpx.Response(200, json={"email": email})
+        return httpx.Response(404)
+
+@pytest.fixture
+def google(admin_client, monkeypatch):
+    response = admin_client.post("/manage/auth", data={
+        "regular_auth_enabled": "true",
+        "google_auth_enabled": "true",
+        "google_client_id": CLIENT_ID,
+        "google_client_secret": "secret",
+    })
+    assert response.status_code == 200, response.text
+    admin_client.cookies.clear()
+
+    fake = FakeGoogle()
+    fake.add_key("key-1")
+    monkeypatch.setattr(google_oauth, "_client", httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)))
+    monkeypatch.setattr(google_oauth, "_certs", {})
+    monkeypatch.setattr(google_oauth, "_certs_expires_at", 0.0)
+    return fake
+
+def callback(client, code: str) -> httpx.Response:
+    response = client.get("/auth/google/callback", params={"code": code}, follow_redirects=False)
+    client.cookies.clear()
+    return response
+
+def test_callbacks_share_one_cert_fetch(client, google):
+    for i in range(5):
+        response = callback(client, f"oauth{i}")
+        assert response.status_code == 302, response.text
+        assert response.headers["location"] == "/dashboard"
+        assert response.cookies["access_token"]
+
+    assert google.cert_fetches == 1
+
+def test_unknown_key_id_refetches_certs(client, google):
+    assert callback(client, "before-rotation").status_code == 302
+    assert google.cert_fetches == 1
+
+    # Google rotates its keys long before the cached certs expire
+    google.add_key("key-2")
+    response = callback(client, "after-rotation")
+    assert response.status_code == 302, response.text
+    assert google.cert_fetches == 2
+
+    assert callback(client, "after-rotation-again").status_code == 302
+    assert google.cert_fetches == 2
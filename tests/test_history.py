@@ -0,0 +1,49 @@
+import asyncio
+import gc
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+from app import alpaca
+from app.history import HistoryCache, _isoformat
+
+START = 1_704_186_000  # 2024-01-02 09:00 UTC, long settled
+END = START + 3600
+
+class FakeBars:
+    """One-minute bars for whatever range is asked for, counting upstream calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        start = int(datetime.fromisoformat(request.url.params["start"].replace("Z", "+00:00")).timestamp())
+        end = int(datetime.fromisoformat(request.url.params["end"].replace("Z", "+00:00")).timestamp())
+        bars = [
+            {"t": _isoformat(t), "o": 1.0, "h": 2.0, "l": 0.5, "c": 1.5, "v": 100}
+            for t in range(start, end + 1, 60)
+        ]
+        return httpx.Response(200, json={"bars": bars, "next_page_token": None})
+
+def test_concurrent_reads_share_one_download_and_release_their_lock(tmp_path, monkeypatch):
+    fake = FakeBars()
+    cache = HistoryCache(tmp_path)
+
+    async def run():
+        client = alpaca.AlpacaClient(http2=False, transport=httpx.MockTransport(fake.handler))
+        monkeypatch.setattr(alpaca, "_client", client)
+        try:
+            return await asyncio.gather(*(cache.get_bars("AAPL", "1m", START, END) for _ in range(5)))
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+    assert fake.calls == 1
+    for bars in results:
+        assert np.array_equal(bars["time"], np.arange(START, END, 60))
+    assert cache.stats["hits"] == 4
+
+    gc.collect()
+    assert len(cache._locks) == 0
@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event, insert
+
+from app import database, models
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+
+def add_users(start: int, count: int):
+    # Inserted directly; hashing real passwords would only slow the test down
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {
+                "email": f"member{i}@example.com",
+                "username": f"member{i}",
+                "hashed_password": "unused",
+                "role_id": 3,
+            }
+            for i in range(start, start + count)
+        ])
+
+def render_manage_page(client) -> list:
+    # One page large enough to hold every user
+    client.get("/manage", params={"limit": 500})  # Warm the role and principal caches
+    with count_queries() as statements:
+        response = client.get("/manage", params={"limit": 500})
+    assert response.status_code == 200, response.text
+    return statements
+
+def test_manage_page_query_count_does_not_grow_with_users(admin_client):
+    add_users(0, 4)
+    small = render_manage_page(admin_client)
+    add_users(4, 195)
+    large = render_manage_page(admin_client)
+
+    assert "member198" in admin_client.get("/manage", params={"limit": 500}).text
+    assert len(large) == len(small), "\n".join(large)
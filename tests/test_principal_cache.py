@@ -0,0 +1,38 @@
+import asyncio
+
+from sqlalchemy import insert, update
+
+from app import auth, database, models
+
+def add_member(username: str) -> int:
+    with database.engine.begin() as conn:
+        return conn.execute(
+            insert(models.User).returning(models.User.id),
+            {"email": f"{username}@example.com", "username": username, "hashed_password": "unused", "role_id": 3}
+        ).scalar_one()
+
+def test_editing_a_user_only_invalidates_that_user(admin_client):
+    member_id = add_member("cache-member")
+    assert admin_client.get("/dashboard").status_code == 200  # Caches the admin's principal
+    admin_entry = auth.principal_cache.get("admin")
+    assert admin_entry is not None
+
+    response = admin_client.put(f"/manage/users/{member_id}", json={"email": "renamed@example.com"})
+    assert response.status_code == 200, response.text
+
+    # The admin's snapshot is still tagged with the current version of their own file
+    assert auth.user_versions.current("admin") == admin_entry[0]
+    assert auth.user_versions.current("cache-member") is not None
+    assert auth.principal_cache.get("cache-member") is None
+
+def test_edited_user_is_reloaded_on_next_lookup():
+    username = "cache-reload"
+    member_id = add_member(username)
+    principal = asyncio.run(auth.get_principal(None, username))
+    assert principal.email == f"{username}@example.com"
+
+    with database.engine.begin() as conn:
+        conn.execute(update(models.User).where(models.User.id == member_id).values(email="new@example.com"))
+    # Another worker made the edit: only the version file tells this one
+    auth.user_versions.bump(username)
+    assert asyncio.run(auth.get_principal(None, username)).email == "new@example.com"
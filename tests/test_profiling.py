@@ -0,0 +1,16 @@
+from app import profiling
+
+def test_profiles_finished_in_the_same_second_are_all_kept(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_DIR", tmp_path)
+    for _ in range(3):
+        response = admin_client.get("/dashboard", headers={profiling.PROFILE_HEADER: "1"})
+        assert response.status_code == 200, response.text
+
+    profiles = list(tmp_path.rglob("*.collapsed"))
+    assert len(profiles) == 3
+    assert all(profile.parent.name == "dashboard" for profile in profiles)
+
+def test_anonymous_profile_header_is_ignored(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_DIR", tmp_path)
+    client.get("/login", headers={profiling.PROFILE_HEADER: "1"})
+    assert not list(tmp_path.rglob("*.collapsed"))
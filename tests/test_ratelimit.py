@@ -0,0 +1,36 @@
+import ipaddress
+
+import pytest
+from starlette.requests import Request
+
+from app import ratelimit
+
+def make_request(peer: str, *forwarded_for: str) -> Request:
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded_for]
+    return Request({"type": "http", "method": "POST", "path": "/login", "headers": headers, "client": (peer, 50000)})
+
+@pytest.fixture
+def trusted_proxies(monkeypatch):
+    networks = tuple(ipaddress.ip_network(proxy) for proxy in ("127.0.0.1", "10.0.0.0/8"))
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUSTED_PROXIES", networks)
+
+def test_peer_address_is_used_without_trusted_proxies():
+    assert ratelimit._client_ip(make_request("10.0.0.5", "203.0.113.7")) == "10.0.0.5"
+
+@pytest.mark.usefixtures("trusted_proxies")
+@pytest.mark.parametrize("peer, forwarded_for, expected", [
+    # The proxy appends the address it saw
+    ("127.0.0.1", ["203.0.113.7"], "203.0.113.7"),
+    # Entries added by the client itself are ignored
+    ("127.0.0.1", ["198.51.100.1, 203.0.113.7"], "203.0.113.7"),
+    # Chained proxies, also when they send separate headers
+    ("127.0.0.1", ["203.0.113.7, 10.1.2.3"], "203.0.113.7"),
+    ("127.0.0.1", ["203.0.113.7", "10.1.2.3"], "203.0.113.7"),
+    # Only trusted hops: the left-most one is the best guess
+    ("127.0.0.1", ["10.1.2.3"], "10.1.2.3"),
+    ("127.0.0.1", [], "127.0.0.1"),
+    # A direct client cannot pick its own bucket
+    ("203.0.113.9", ["198.51.100.1"], "203.0.113.9"),
+])
+def test_forwarded_client_behind_trusted_proxy(peer, forwarded_for, expected):
+    assert ratelimit._client_ip(make_request(peer, *forwarded_for)) == expected